@@ -0,0 +1,153 @@
+"""
+Benchmark engine configurations on a fixed set of positions
+
+  python -m real_games.benchmark chess --n-engines 1,2,4 --threads 1,2 --hash 16,64 --output chess-engines.json
+  python -m real_games.benchmark othello --n-engines 1,2 --threads 1,2 --hash 18,20 --output othello-engines.json
+
+For every combination of engine count, threads per engine and hash size,
+the positions are evaluated on a pool of engines (like `--n-engines` of the runners).
+Nodes/second and evaluations/hour are printed, and the configuration with the most evaluations/hour
+is written into a JSON file, which the runners load with `--engine-config`:
+
+  {"game": "chess", "n_engines": 2, "options": {"Threads": 1, "Hash": 64}, "results": [...]}
+
+Positions come from random games (seeded), so every configuration evaluates the same positions.
+"""
+
+import json
+import os
+import random
+import time
+from itertools import product
+from typing import Callable, Dict, List
+import click
+from real_games.engine_pool import EnginePool
+
+# game -> names of the engine options for threads and hash size
+OPTION_NAMES = {
+  'chess': ('Threads', 'Hash'), # Hash in MB
+  'othello': ('n-tasks', 'hash-table-size'), # hash-table-size in bits
+}
+
+
+def _chess():
+  from real_games.chess_game.src.stockfish import Engine
+  from real_games.chess_game.src.assess import evaluate
+
+  def create_engine(options: Dict) -> Engine:
+    return Engine(parameters=options)
+
+  def task(engine: Engine, position: Dict, depth: int) -> int:
+    """Evaluate `position`, return the number of searched nodes"""
+    evaluate(engine, position['fen'], [], depth)
+    tokens = engine.info.split(' ')
+    return int(tokens[tokens.index('nodes') + 1]) if 'nodes' in tokens else 0
+
+  return create_engine, task
+
+
+def _othello():
+  from real_games.othello.src.edax import Engine
+  from real_games.othello.src.assess import evaluate
+
+  def create_engine(options: Dict) -> Engine:
+    return Engine(options=options)
+
+  def task(engine: Engine, position: Dict, depth: int) -> int:
+    """Evaluate `position`, return the number of searched nodes"""
+    engine.info = ''
+    evaluate(engine, position['moves'], depth)
+    tokens = engine.info.split()
+    return int(tokens[3]) if len(tokens) > 3 else 0 # game over: no search
+
+  return create_engine, task
+
+
+GAMES = {'chess': _chess, 'othello': _othello}
+
+
+def benchmark(create_engine: Callable, task: Callable, positions: List[Dict], depth: int, \
+  n_engines: int, options: Dict) -> Dict:
+  """Evaluate `positions` on `n_engines` engines with `options`, return the measures"""
+  pool = EnginePool(lambda: create_engine(options), n_engines)
+  tic = time.time()
+  futures = [pool.submit(task, position, depth) for position in positions]
+  nodes = sum(future.result() for future in futures)
+  seconds = time.time() - tic
+  pool.close()
+  return {
+    'n_engines': n_engines,
+    'options': options,
+    'seconds': seconds,
+    'nodes_per_second': nodes / seconds,
+    'evaluations_per_hour': len(positions) * 3600 / seconds,
+  }
+
+
+def _int_list(_ctx, _param, value: str) -> List[int]:
+  return [int(x) for x in value.split(',')]
+
+
+@click.command()
+@click.argument('game', type=click.Choice(list(GAMES)))
+@click.option('--n-engines', type=str, default='1,2,4', callback=_int_list, \
+  help='Comma-separated engine counts to try')
+@click.option('--threads', type=str, default='1,2', callback=_int_list, \
+  help='Comma-separated numbers of threads per engine to try')
+@click.option('--hash', 'hash_sizes', type=str, default=None, \
+  help='Comma-separated hash sizes to try (MB for chess, bits for othello; default: 16 / 18)')
+@click.option('--max-threads', type=int, default=os.cpu_count(), \
+  help='Skip configurations using more threads in total (default: no. CPUs)')
+@click.option('--n-positions', type=int, default=20, help='No. positions to evaluate')
+@click.option('--position-depth', type=int, default=20, help='Depth of the random positions')
+@click.option('--search-depth', type=int, default=12, help='Search depth of the evaluations')
+@click.option('--seed', type=int, default=0, help='Seed of the random positions')
+@click.option('--output', type=click.Path(dir_okay=False), default=None, \
+  help='JSON file for the recommended configuration (default: <game>-engines.json)')
+def main(game, n_engines, threads, hash_sizes, max_threads, n_positions, position_depth, search_depth, seed, output):
+  create_engine, task = GAMES[game]()
+  thread_option, hash_option = OPTION_NAMES[game]
+  hash_sizes = _int_list(None, None, hash_sizes or ('16' if game == 'chess' else '18'))
+
+  random.seed(seed)
+  generator = create_engine({})
+  positions = [dict(generator.random_position(position_depth, 0)) for _ in range(n_positions)]
+  del generator
+
+  results = []
+  for n, n_threads, hash_size in product(n_engines, threads, hash_sizes):
+    if n * n_threads > max_threads:
+      print(f'Skip {n} engines x {n_threads} threads (more than {max_threads} threads)')
+      continue
+    result = benchmark(create_engine, task, positions, search_depth, n, \
+      {thread_option: n_threads, hash_option: hash_size})
+    print(f'{n} engines, {thread_option}={n_threads}, {hash_option}={hash_size}: ' \
+      f'{result["nodes_per_second"]:.0f} nodes/s, {result["evaluations_per_hour"]:.0f} evaluations/hour')
+    results.append(result)
+
+  if not results:
+    raise click.UsageError('No configuration within --max-threads')
+  best = max(results, key=lambda result: result['evaluations_per_hour'])
+  output = output or f'{game}-engines.json'
+  with open(output, 'w') as file:
+    json.dump({
+      'game': game,
+      'n_engines': best['n_engines'],
+      'options': best['options'],
+      'search_depth': search_depth,
+      'results': results,
+    }, file, indent=2)
+  print(f'Recommended: {best["n_engines"]} engines, {best["options"]} (written to {output})')
+
+
+def load_engine_config(path: str, game: str) -> Dict:
+  """Read a configuration written by this benchmark for `game`"""
+  with open(path) as file:
+    config = json.load(file)
+  if config['game'] != game:
+    raise click.BadParameter(f'{path} is a configuration for {config["game"]}, not {game}')
+  return config
+
+
+if __name__ == '__main__':
+  main()
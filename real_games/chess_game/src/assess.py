@@ -1,93 +1,265 @@
 """
 Assessment functions for Chess positions
+
+Every engine call is a task `task(engine, ...)` submitted to an executor:
+the EnginePool when one is given, otherwise the single `engine`.
+Tasks are submitted first and their results logged afterwards, in order,
+so independent evaluations run concurrently on a pool.
 """
 
-from typing import Dict
+import time
+from typing import Dict, List
 from real_games.chess_game.src.stockfish import Engine
+from real_games.engine_pool import EnginePool, SerialExecutor, completed
 from real_games.utils import parse_eval
 
-def assess_criticality(engine: Engine, logger, position: Dict, search_depth):
+def evaluate(engine: Engine, fen: str, moves: List[str], depth: int, nodes: int = None, \
+  keep_hash: bool = False) -> Dict:
+  """
+  Evaluate the position after `moves` from `fen` with a search of `depth`,
+  or of `nodes` nodes when it is given (the score of the last `info` line).
+  The engine evokes a new game (`ucinewgame`) first, so both are reproducible with 1 thread.
+  With `keep_hash`, it does not when its last searches were from the same `fen`
+  (see `Engine.set_sibling_position`): faster, but the score depends on the previous searches.
+  The evaluation also has the search budget (`depth`, `nodes`) and its duration (`seconds`), for records.
+  """
+  tic = time.perf_counter()
+  if keep_hash:
+    engine.set_sibling_position(fen, moves)
+  else:
+    engine.set_fen_position(fen, moves)
+  engine.set_depth(depth)
+  engine.set_nodes(nodes)
+  evaluation = engine.get_evaluation()
+  return dict(evaluation, depth=depth if nodes is None else None, nodes=nodes, seconds=time.perf_counter() - tic)
+
+def evaluate_static(engine: Engine, fen: str, moves: List[str]) -> Dict:
+  """
+  Static eval of the position after `moves` from `fen` (`eval`: no search, and no `ucinewgame`),
+  or a search of depth 1 (after a new game) when the side to move is in check, which has no static eval.
+  Static evals skip the eval cache: `eval` takes less time than a lookup.
+  The evaluation also has `depth` (0 for a static eval) and its duration (`seconds`), for records.
+  """
+  tic = time.perf_counter()
+  engine.set_fen_position(fen, moves, send_ucinewgame_token=False)
+  evaluation = engine.get_static_eval()
+  if evaluation is None:
+    evaluation = evaluate(engine, fen, moves, 1)
+    return dict(evaluation, seconds=time.perf_counter() - tic)
+  return dict(evaluation, depth=0, nodes=None, seconds=time.perf_counter() - tic)
+
+def evaluate_by_depth(engine: Engine, fen: str, moves: List[str], depth: int, nodes: int = None) -> Dict[int, Dict]:
+  """
+  Evaluate the position after `moves` from `fen` at every depth up to `depth`
+  (or reached with `nodes` nodes) with one search: depth -> evaluation.
+  The engine evokes a new game (`ucinewgame`) first.
+  Only the deepest evaluation has the duration of the search (`seconds`).
+  """
+  tic = time.perf_counter()
+  engine.set_fen_position(fen, moves)
+  engine.set_depth(depth)
+  engine.set_nodes(nodes)
+  evaluations = engine.get_evaluations_by_depth()
+  seconds = time.perf_counter() - tic
+  deepest = max(evaluations)
+  return {k: dict(evaluation, depth=k, nodes=nodes if k == deepest else None, \
+    seconds=seconds if k == deepest else None) for k, evaluation in evaluations.items()}
+
+def legal_moves(engine: Engine, fen: str, moves: List[str]) -> List[str]:
+  """Return the legal moves of the position after `moves` from `fen`"""
+  engine.set_fen_position(fen, moves, send_ucinewgame_token=False)
+  return engine.next_moves()
+
+def evaluate_children(engine: Engine, fen: str, next_moves: List[str], depth: int) -> Dict[str, Dict]:
+  """
+  Evaluate the children of `fen` (reached by `next_moves`) with one MultiPV search of `depth`
+  at the root, i.e. every child is searched with `depth-1`.
+  The engine evokes a new game (`ucinewgame`) first.
+  """
+  tic = time.perf_counter()
+  engine.set_fen_position(fen)
+  engine.set_depth(depth)
+  engine.set_nodes(None)
+  evaluations = engine.get_children_evaluations(next_moves)
+  # the search is shared by the children
+  seconds = (time.perf_counter() - tic) / max(len(evaluations), 1)
+  return {move: dict(evaluation, depth=depth-1, seconds=seconds) for move, evaluation in evaluations.items()}
+
+def compare_hash(engine: Engine, fen: str, next_moves: List[str], depth: int, nodes: int = None) -> Dict:
+  """
+  Evaluate the children of `fen` (reached by `next_moves`) one after the other,
+  with a new game for each child (clean hash) and then keeping the hash across the children.
+  Return the evaluations (`clean`, `kept`, in the order of `next_moves`) and the time of each mode.
+  The eval cache is not used, so that both modes search.
+  """
+  result = {}
+  eval_cache, engine.eval_cache = engine.eval_cache, None
+  try:
+    for mode, keep_hash in (('clean', False), ('kept', True)):
+      tic = time.perf_counter()
+      result[mode] = [evaluate(engine, fen, [next_move], depth, nodes, keep_hash) for next_move in next_moves]
+      result[f'{mode}_seconds'] = time.perf_counter() - tic
+  finally:
+    engine.eval_cache = eval_cache
+  return result
+
+def assess_criticality(engine: Engine, logger, position: Dict, search_depth, pool: EnginePool = None, \
+  multipv: bool = False, search_nodes: int = None, keep_hash: bool = False):
   """
     Analyzes the number of flipping children, finds the rate that minimax value is flipped.
     The engine will evoke new game (`ucinewgame`) for each position.
 
-    `position` is a dictionary which 1 required key (`fen`) 
+    If `multipv`, all children are evaluated by a single MultiPV search at the root
+    (children the engine does not report are evaluated separately),
+    otherwise every child is searched on its own.
+    With `search_nodes`, the root and every child are searched with that many nodes instead of a depth
+    (not with `multipv`, whose lines are read at `search_depth`).
+    With `keep_hash`, the searches of a position and its children share the hash of their engine.
+
+    `position` is a dictionary which 1 required key (`fen`)
     and 1 optional key (`moves`, mostly used for debugging)
   """
-  
-  engine.set_fen_position(position['fen'])
-  logger.print(position['fen'])
-  
-  engine.set_depth(search_depth)
-  score = engine.get_evaluation()
-  logger.print(parse_eval(score))
-
-  next_moves = engine.next_moves()
-  if len(next_moves) != 0:
-    engine.set_depth(search_depth-1) # decrease search depth for child nodes
-    for next_move in next_moves:
-      engine._put(f'position fen {position["fen"]} moves {next_move}')
-      engine._start_new_game()
-      child_score = engine.get_evaluation()
-      logger.print(parse_eval(child_score))
-
-def assess_noise(engine: Engine, logger, position: Dict, depth):
-  """
-  Assess the static eval and search eval for a position. 
+  executor = pool if pool is not None else SerialExecutor(engine)
+  fen = position['fen']
+  logger.print(fen)
+  logger.record_position(fen)
+
+  score = executor.submit(evaluate, fen, [], search_depth, search_nodes, keep_hash)
+  next_moves = executor.submit(legal_moves, fen, []).result()
+  if multipv:
+    evaluations = executor.submit(evaluate_children, fen, next_moves, search_depth).result()
+    child_scores = [completed(evaluations[next_move]) if next_move in evaluations \
+      else executor.submit(evaluate, fen, [next_move], search_depth-1, None, keep_hash) \
+      for next_move in next_moves]
+  else:
+    # decrease search depth for child nodes
+    child_scores = [executor.submit(evaluate, fen, [next_move], search_depth-1, search_nodes, keep_hash) \
+      for next_move in next_moves]
+
+  logger.print(parse_eval(score.result()))
+  logger.record_evaluation(score.result())
+  for i, (next_move, child_score) in enumerate(zip(next_moves, child_scores)):
+    logger.print(parse_eval(child_score.result()))
+    logger.record_evaluation(child_score.result(), child=i, move=next_move)
+
+def assess_noise(engine: Engine, logger, position: Dict, depth, pool: EnginePool = None, \
+  search_nodes: int = None, depth_curve: bool = False, static_eval: bool = False):
+  """
+  Assess the static eval and search eval for a position.
   Log 2 lines to logger: position and result
+  With `search_nodes`, the search eval has that many nodes instead of `depth`.
+  With `depth_curve`, both are read from one search (its depth 1 and its last depth)
+  instead of a search of depth 1 and another one.
+  With `static_eval`, the static eval is the `eval` command of the engine instead of a search of depth 1
+  (see `evaluate_static`).
 
   The engine will evoke new game (`ucinewgame`) for each position.
-  
-  `position` is a dictionary which 1 required key (`fen`) 
+
+  `position` is a dictionary which 1 required key (`fen`)
   and 1 optional key (`moves`, mostly used for debugging)
   """
-  engine.set_fen_position(position['fen'])
-  
-  engine._start_new_game()
-  engine.set_depth(1)
-  static_evaluation = engine.get_evaluation()
-  
-  engine._start_new_game()
-  engine.set_depth(depth)
-  search_evaluation = engine.get_evaluation()
+  executor = pool if pool is not None else SerialExecutor(engine)
+  if depth_curve:
+    evaluations = executor.submit(evaluate_by_depth, position['fen'], [], depth, search_nodes).result()
+    # no depth 1 when the position has no legal move
+    static_evaluation = evaluations.get(1, evaluations[min(evaluations)])
+    search_evaluation = evaluations[max(evaluations)]
+  else:
+    if static_eval:
+      static_evaluation = executor.submit(evaluate_static, position['fen'], [])
+    else:
+      static_evaluation = executor.submit(evaluate, position['fen'], [], 1)
+    search_evaluation = executor.submit(evaluate, position['fen'], [], depth, search_nodes)
+    static_evaluation, search_evaluation = static_evaluation.result(), search_evaluation.result()
 
   logger.print(position['fen'])
   logger.print(f'{parse_eval(static_evaluation)} {parse_eval(search_evaluation)}')
+  logger.record_position(position['fen'])
+  logger.record_evaluation(static_evaluation)
+  logger.record_evaluation(search_evaluation)
   return (static_evaluation, search_evaluation)
 
-def assess_flipping_corelation(engine: Engine, logger, position: Dict, search_depth):
+def assess_flipping_corelation(engine: Engine, logger, position: Dict, search_depth, pool: EnginePool = None, \
+  search_nodes: int = None, keep_hash: bool = False):
   """
     The engine will evoke new game (`ucinewgame`) for each position.
+    With `search_nodes`, every search has that many nodes instead of a depth.
+    With `keep_hash`, the searches of a position, its children and grandchildren share the hash of their engine.
 
-    `position` is a dictionary which 1 required key (`fen`) 
+    `position` is a dictionary which 1 required key (`fen`)
     and 1 optional key (`moves`, mostly used for debugging)
   """
-  
-  engine.set_fen_position(position['fen'])
-  logger.print(position['fen'])
-  
-  engine.set_depth(search_depth)
-  score = engine.get_evaluation()
-  logger.print(parse_eval(score))
+  executor = pool if pool is not None else SerialExecutor(engine)
+  fen = position['fen']
+  logger.print(fen)
+
+  score = executor.submit(evaluate, fen, [], search_depth, search_nodes, keep_hash)
+  next_moves = executor.submit(legal_moves, fen, []).result()
+  # decrease search depth for child nodes
+  child_scores = [executor.submit(evaluate, fen, [next_move], search_depth-1, search_nodes, keep_hash) \
+    for next_move in next_moves]
+  next_next_moves = [executor.submit(legal_moves, fen, [next_move]) for next_move in next_moves]
+  grand_child_scores = [
+    [executor.submit(evaluate, fen, [next_move, next_next_move], search_depth-2, search_nodes, keep_hash) \
+      for next_next_move in moves.result()]
+    for next_move, moves in zip(next_moves, next_next_moves)
+  ]
+
+  logger.record_position(fen)
+  logger.print(parse_eval(score.result()))
+  logger.record_evaluation(score.result())
   logger.print('Children')
+  for i, (next_move, child_score) in enumerate(zip(next_moves, child_scores)):
+    logger.print(f'{next_move} {parse_eval(child_score.result())}')
+    logger.record_evaluation(child_score.result(), child=i, move=next_move)
 
-  next_moves = engine.next_moves()
-  if len(next_moves) != 0:
-    engine.set_depth(search_depth-1) # decrease search depth for child nodes
-    for next_move in next_moves:
-      engine._put(f'position fen {position["fen"]} moves {next_move}')
-      engine._start_new_game()
-      child_score = engine.get_evaluation()
-      logger.print(f'{next_move} {parse_eval(child_score)}')
-  
   logger.print('Grand children')
-  engine.set_depth(search_depth-2)
-  for next_move in next_moves:
+  for i, (next_move, moves, scores) in enumerate(zip(next_moves, next_next_moves, grand_child_scores)):
     logger.print(f'First move = {next_move}')
-    engine._put(f'position fen {position["fen"]} moves {next_move}')
-    next_next_moves = engine.next_moves()
-    for next_next_move in next_next_moves:
-      engine._put(f'position fen {position["fen"]} moves {next_move} {next_next_move}')
-      engine._start_new_game()
-      grand_child_score = engine.get_evaluation()
-      logger.print(parse_eval(grand_child_score))
\ No newline at end of file
+    for j, (next_next_move, grand_child_score) in enumerate(zip(moves.result(), scores)):
+      logger.print(parse_eval(grand_child_score.result()))
+      logger.record_evaluation(grand_child_score.result(), child=i, grandchild=j, \
+        move=f'{next_move} {next_next_move}')
+
+def assess_hash_comparison(engine: Engine, logger, position: Dict, search_depth, pool: EnginePool = None, \
+  search_nodes: int = None):
+  """
+  Compare the evaluation of the children of a position with a clean hash for each child
+  (as criticality does by default) and with the hash kept across the children (`--keep-hash`).
+  Log the position, the time of each mode (`Seconds: <clean> <kept>`),
+  then `<move> <clean eval> <kept eval>` for every child.
+  Records have the clean evaluations of the children, then the kept ones.
+
+  Both modes run on the same engine, one after the other, so their times are comparable.
+  """
+  executor = pool if pool is not None else SerialExecutor(engine)
+  fen = position['fen']
+  next_moves = executor.submit(legal_moves, fen, []).result()
+  result = executor.submit(compare_hash, fen, next_moves, search_depth-1, search_nodes).result()
+
+  logger.print(fen)
+  logger.record_position(fen)
+  logger.print(f'Seconds: {result["clean_seconds"]:.3f} {result["kept_seconds"]:.3f}')
+  for next_move, clean, kept in zip(next_moves, result['clean'], result['kept']):
+    logger.print(f'{next_move} {parse_eval(clean)} {parse_eval(kept)}')
+  for mode in ('clean', 'kept'):
+    for i, (next_move, evaluation) in enumerate(zip(next_moves, result[mode])):
+      logger.record_evaluation(evaluation, child=i, move=next_move)
+
+def assess_depth_curve(engine: Engine, logger, position: Dict, search_depth, pool: EnginePool = None, \
+  search_nodes: int = None):
+  """
+  Log the evaluation of a position at every depth up to `search_depth` (or reached with `search_nodes`),
+  read from one iterative-deepening search: the position, then `<depth> <eval>` for every depth.
+
+  `position` is a dictionary which 1 required key (`fen`)
+  """
+  executor = pool if pool is not None else SerialExecutor(engine)
+  fen = position['fen']
+  evaluations = executor.submit(evaluate_by_depth, fen, [], search_depth, search_nodes).result()
+
+  logger.print(fen)
+  logger.record_position(fen)
+  for depth, evaluation in sorted(evaluations.items()):
+    logger.print(f'{depth} {parse_eval(evaluation)}')
+    logger.record_evaluation(evaluation)
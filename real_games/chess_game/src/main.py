@@ -8,29 +8,63 @@
 
 import subprocess
 import click
+from functools import partial
 from os.path import join
-from real_games.chess_game.src.assess import assess_criticality, assess_flipping_corelation, assess_noise
+from real_games.chess_game.src.assess import assess_criticality, assess_depth_curve, assess_flipping_corelation, assess_hash_comparison, assess_noise
 from real_games.utils import Logger
+from real_games.engine_pool import EnginePool, Supervisor, assess_concurrently
+from real_games.pipeline import run_pipeline
+from real_games.benchmark import load_engine_config
+from real_games.eval_cache import EvalCache
+from real_games.engine_server import EngineClient, check_leases
+from real_games.corpus import corpus_positions
 from real_games.chess_game.src.stockfish import Engine
 import time
 
-OBJECTIVES = ['criticality', 'noise']
+OBJECTIVES = ['criticality', 'noise', 'hash-comparison', 'depth-curve']
 
 
 def init_logger(batch_id, job_id, objective, n_positions, position_depth, \
-  search_depth, n_top_moves) -> Logger:
+  search_depth, n_top_moves, eval_cache: EvalCache = None, child_eval: str = 'search', \
+  engine_options: dict = None, search_nodes: int = None, records: bool = False, resume: bool = False, \
+  keep_hash: bool = False, engine_server: str = None, corpus: str = None, \
+  depth_curve: bool = False, top_moves_cache: EvalCache = None, static_eval: bool = False) -> Logger:
   
   base_path = join('logs', batch_id) 
   subprocess.run(['mkdir', '-p', base_path])
   filepath = join(base_path, job_id + '.txt')
-  logger = Logger(filepath)
   title = f"""Objective: {objective}
   Num positions: {n_positions}
   Position depth: {position_depth}
   Search depth: {search_depth}
   Num top moves: {n_top_moves}
   """
-  logger.print(title)
+  if eval_cache is not None:
+    title += f"Eval cache: {eval_cache.summary()}\n  "
+  if child_eval != 'search':
+    title += f"Child evaluation: {child_eval}\n  "
+  if engine_options:
+    title += f"Engine options: {engine_options}\n  "
+  if search_nodes is not None:
+    title += f"Search nodes: {search_nodes}\n  "
+  if keep_hash:
+    title += "Keep hash: siblings\n  "
+  if engine_server is not None:
+    title += f"Engine server: {engine_server}\n  "
+  if corpus is not None:
+    title += f"Corpus: {corpus}\n  "
+  if depth_curve:
+    title += "Depth curve: static and search evals from one search\n  "
+  if top_moves_cache is not None:
+    title += f"Top-moves cache: {top_moves_cache.summary()}\n  "
+  if static_eval:
+    title += "Static eval: eval command\n  "
+  try:
+    logger = Logger(filepath, join(base_path, job_id + '.rec') if records else None, resume, header=title)
+  except ValueError as error:
+    raise click.UsageError(str(error))
+  if logger.resumed:
+    print(f'Resuming {filepath} after {logger.n_completed} positions')
   return logger
 
 # template: python -m chess_game.src.main flip-grand big small
@@ -40,6 +74,8 @@ def init_logger(batch_id, job_id, objective, n_positions, position_depth, \
 @click.argument('job-id', type=str)
 @click.option('--search-depth', type=int, default=20, \
   help="Search depth for Stockfish evaluation")
+@click.option('--search-nodes', type=int, default=None, \
+  help='Node budget for Stockfish evaluations (`go nodes`), instead of --search-depth (noise: the static eval stays depth 1)')
 @click.option('--n-positions', type=int, default=2, \
   help='No. positions to analyze')
 @click.option('--n-top-moves', type=int, default=0, \
@@ -49,30 +85,165 @@ def init_logger(batch_id, job_id, objective, n_positions, position_depth, \
   help='Depth of generated positions')
 @click.option('--generation-search-depth', type=int, default=10, \
   help='Depth of top-move search for position generation')
-def run_exp(objective, batch_id, job_id, search_depth, n_positions, n_top_moves, position_depth, generation_search_depth):
+@click.option('--n-engines', type=int, default=None, \
+  help='No. engine processes evaluating positions concurrently (default: from --engine-config, or 1)')
+@click.option('--engine-config', type=click.Path(exists=True, dir_okay=False), default=None, \
+  help='JSON file written by `python -m real_games.benchmark chess`: engine options and no. engines')
+@click.option('--n-generators', type=int, default=0, \
+  help='No. engine processes generating positions in a pipeline, \
+    while --n-engines processes assess them (0: no pipeline)')
+@click.option('--corpus', type=click.Path(exists=True, dir_okay=False), default=None, \
+  help='Position corpus (see real_games/corpus.py): assess its positions of the generation parameters \
+    instead of generating new ones')
+@click.option('--engine-server', type=click.Path(exists=True, dir_okay=False), default=None, \
+  help='Unix socket of `python -m real_games.engine_server chess`, whose warm engines replace local ones')
+@click.option('--engine-timeout', type=float, default=None, \
+  help='Seconds an engine may take to answer before it is killed and restarted (default: no limit)')
+@click.option('--engine-retries', type=int, default=2, \
+  help='No. times an engine is restarted in a row after dying or timing out, before the run fails')
+@click.option('--resume', is_flag=True, default=False, \
+  help='Continue the log of an interrupted run with the same job id, after its last complete position')
+@click.option('--records', is_flag=True, default=False, \
+  help='Also write binary records of the evaluations (<job-id>.rec, see real_games/records.py)')
+@click.option('--eval-cache', type=click.Path(dir_okay=False), default=None, \
+  help='SQLite file caching evaluations across runs (disabled by default)')
+@click.option('--top-moves-cache', type=click.Path(dir_okay=False), default=None, \
+  help='SQLite file caching the top moves of generated positions across runs (--n-top-moves > 0), \
+    so common openings are searched once (disabled by default)')
+@click.option('--child-eval', type=click.Choice(['search', 'multipv']), default='search', \
+  help='Criticality: search every child on its own, or evaluate all children with one MultiPV search at the root')
+@click.option('--keep-hash', is_flag=True, default=False, \
+  help='Criticality: keep the hash (no `ucinewgame`) between the searches of a position and its children \
+    (faster, but the scores depend on the order of the searches; compare with the hash-comparison objective)')
+@click.option('--depth-curve', is_flag=True, default=False, \
+  help='Noise: read the static (depth 1) and search evals from the depths of one search, instead of two searches')
+@click.option('--static-eval', is_flag=True, default=False, \
+  help='Noise: static eval from the `eval` command of the engine (no search; depth 1 search when in check) \
+    instead of a search of depth 1')
+@click.option('--hash', 'hash_size', type=int, default=None, \
+  help='Hash size of the engines in MB (default: from --engine-config, or the engine default)')
+def run_exp(objective, batch_id, job_id, search_depth, search_nodes, n_positions, n_top_moves, position_depth, generation_search_depth, n_engines, engine_config, n_generators, corpus, engine_server, engine_timeout, engine_retries, resume, records, eval_cache, top_moves_cache, child_eval, keep_hash, depth_curve, static_eval, hash_size):
+  if search_nodes is not None and child_eval == 'multipv':
+    raise click.BadParameter('--child-eval multipv reads MultiPV lines at --search-depth, use it without --search-nodes')
+  if depth_curve and objective != 'noise':
+    raise click.BadParameter('--depth-curve reads the evals of noise from one search, use it with noise')
+  if static_eval and (objective != 'noise' or depth_curve):
+    raise click.BadParameter('--static-eval is the static eval of noise, use it with noise and without --depth-curve')
+  if keep_hash and objective != 'criticality':
+    raise click.BadParameter('--keep-hash shares the hash between the children of a position, use it with criticality')
   tic = time.time()
-  logger = init_logger(batch_id, job_id, objective, n_positions, position_depth, search_depth, n_top_moves)
-  engine = Engine()
+  engine_options = {}
+  if engine_config is not None:
+    engine_config = load_engine_config(engine_config, 'chess')
+    engine_options = engine_config['options']
+    if n_engines is None:
+      n_engines = engine_config['n_engines']
+  if n_engines is None:
+    n_engines = 1
+  if hash_size is not None:
+    engine_options = dict(engine_options, Hash=hash_size)
+  if engine_server is not None and (engine_options or eval_cache is not None or top_moves_cache is not None):
+    raise click.BadParameter('Engines of --engine-server have the options and caches of the server')
+  if corpus is not None:
+    if n_generators > 0:
+      raise click.BadParameter('Positions of --corpus are not generated, use it without --n-generators')
+    positions = corpus_positions(corpus, 'chess', dict(position_depth=position_depth, n_top_moves=n_top_moves, \
+      generation_search_depth=generation_search_depth), n_positions)
+  if engine_server is not None:
+    # leases held at the same time: pipeline workers, or the pool and its generator, or one runner
+    if n_generators > 0:
+      n_leases = n_generators + n_engines
+    elif n_engines > 1:
+      n_leases = n_engines + (corpus is None)
+    else:
+      n_leases = 1
+    check_leases(engine_server, n_leases)
+  if eval_cache is not None:
+    eval_cache = EvalCache(eval_cache)
+  if top_moves_cache is not None:
+    top_moves_cache = EvalCache(top_moves_cache, 'Top-moves cache')
+  logger = init_logger(batch_id, job_id, objective, n_positions, position_depth, search_depth, n_top_moves, eval_cache, child_eval, engine_options, search_nodes, records=records, resume=resume, keep_hash=keep_hash, engine_server=engine_server, corpus=corpus, \
+    depth_curve=depth_curve, top_moves_cache=top_moves_cache, static_eval=static_eval)
+  n_positions -= logger.n_completed
+  if corpus is not None:
+    # positions come from the corpus, no engine generates them
+    next_position = iter(positions[logger.n_completed:]).__next__
+
+  def create_engine():
+    engine = Engine(parameters=engine_options)
+    engine.eval_cache = eval_cache
+    engine.top_moves_cache = top_moves_cache
+    return engine
 
   has_children = True
 
   OBJECTIVE_TO_ASSESS = {
     'criticality': assess_criticality,
-    'noise': assess_noise
+    'noise': assess_noise,
+    'hash-comparison': assess_hash_comparison,
+    'depth-curve': assess_depth_curve,
   }
   assess = OBJECTIVE_TO_ASSESS[objective]
+  if objective == 'criticality' and child_eval == 'multipv':
+    assess = partial(assess_criticality, multipv=True)
+  if search_nodes is not None:
+    assess = partial(assess, search_nodes=search_nodes)
+  if keep_hash:
+    assess = partial(assess, keep_hash=True)
+  if depth_curve:
+    assess = partial(assess, depth_curve=True)
+  if static_eval:
+    assess = partial(assess, static_eval=True)
+
+  # a partial of a method (rather than a closure) can be sent to an engine server
+  generate = partial(Engine.random_position, depth=position_depth, \
+    n_top_moves=n_top_moves, generation_search_depth=generation_search_depth, \
+      has_children=has_children)
+
+  def create_runner():
+    """Runs the tasks on an engine: a supervised local one, or a lease on the engine server"""
+    if engine_server is not None:
+      return EngineClient(engine_server)
+    return Supervisor(create_engine, engine_timeout, engine_retries)
 
-  for i in range(n_positions):
-    position = engine.random_position(position_depth, \
-      n_top_moves, generation_search_depth=generation_search_depth, \
-        has_children=has_children)
-    print(f'Position {i+1}/{n_positions}')
-    
-    # Assess functions: write just enough info about a position into the logger
-    assess(engine, logger, position, search_depth)
-    logger.print("END")
+  if n_generators > 0:
+    # generators and assessors each have their own engines
+    run_pipeline(create_engine, generate, assess, logger, n_positions, search_depth, n_generators, n_engines, \
+      create_runner=create_runner)
+  elif n_engines > 1:
+    # evaluations run on a pool of engines, another engine only generates positions
+    if corpus is None:
+      generator = create_runner()
+      next_position = partial(generator.run, generate)
+    pool = EnginePool(create_engine, n_engines, create_runner=create_runner)
+    assess_concurrently(next_position, assess, logger, pool, n_positions, search_depth)
+    pool.close()
+    if corpus is None:
+      generator.close()
+  else:
+    # a supervisor restarts the engine when it dies or hangs, and runs its task again
+    runner = create_runner()
+    if corpus is None:
+      next_position = partial(runner.run, generate)
+    for i in range(n_positions):
+      position = next_position()
+      print(f'Position {i+1}/{n_positions}')
+      
+      # Assess functions: write just enough info about a position into the logger
+      assess(None, logger, position, search_depth, runner)
+      logger.end_position()
+    runner.close()
   
+  # statistics of the run, after the last position (cut when the log is resumed)
+  if eval_cache is not None:
+    logger.print(eval_cache.run_summary())
+  if top_moves_cache is not None:
+    logger.print(top_moves_cache.run_summary())
   logger.close()
+  if eval_cache is not None:
+    eval_cache.close()
+  if top_moves_cache is not None:
+    top_moves_cache.close()
 
   toc = time.time()
   print(f'\n{toc - tic} seconds')
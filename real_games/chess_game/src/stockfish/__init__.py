@@ -1 +1,2 @@
-from .engine import Engine
\ No newline at end of file
+from .engine import Engine
+from .async_stockfish import AsyncStockfish
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+Asyncio client for a UCI engine (Stockfish by default).
+
+It exposes the operations of `Engine` as coroutines, so that one Python
+process (one thread) can keep many engines busy:
+
+    engines = [await AsyncStockfish.create(depth=10) for _ in range(8)]
+    scores = await asyncio.gather(*[
+        engine.evaluate(fen) for engine, fen in zip(engines, fens)
+    ])
+
+Commands that do not need an answer are written back-to-back (pipelined):
+all options are set before a single `isready`, and `evaluate` sends
+`ucinewgame`, `isready`, `position` and `go` in one write.
+Every operation holds a per-engine lock, and fails with
+`asyncio.TimeoutError` if the engine does not finish it within `timeout` seconds.
+The engine process is then killed, since the rest of the interrupted output would be read
+by the next operation: later operations fail with `BrokenPipeError`, and a new engine must be created.
+
+This is a library for scripts that drive engines from asyncio; the experiment runners
+(`main.py`, `EnginePool`, the pipeline) use the thread-based `Engine`.
+"""
+
+import asyncio
+import copy
+from os.path import join
+from sys import platform
+from typing import Any, Dict, List, Optional
+from real_games.chess_game.src.stockfish.stockfish import Stockfish
+
+
+class AsyncStockfish:
+    """Asyncio counterpart of `Engine` (Stockfish + our extensions)."""
+
+    def __init__(self, depth: int = 2, timeout: Optional[float] = None) -> None:
+        """Use `await AsyncStockfish.create(...)` to start an engine."""
+        self.depth = str(depth)
+        self.timeout = timeout
+        self.info: str = ""
+        self._parameters: Dict[str, Any] = {}
+        self._white_to_move = True
+        self._lock = asyncio.Lock()
+        self._stockfish_major_version: Optional[int] = None
+
+    @classmethod
+    async def create(
+        cls, path: str = None, depth: int = 2, parameters: dict = None, timeout: Optional[float] = None
+    ) -> "AsyncStockfish":
+        """Starts the engine process and sets its options (same defaults as `Stockfish`)."""
+        self = cls(depth, timeout)
+        is_stockfish = False
+        if path is None:
+            filename = 'stockfish.exe' if platform == 'win32' else 'stockfish'
+            path = join('real_games', 'chess_game', 'src', 'stockfish', filename)
+            is_stockfish = True
+
+        self.engine = await asyncio.create_subprocess_exec(
+            path, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+        )
+        await self._run(self._init(is_stockfish, parameters))
+        return self
+
+    async def _init(self, is_stockfish: bool, parameters: Optional[dict]) -> None:
+        if is_stockfish:
+            self._stockfish_major_version = int((await self._read_line()).split(" ")[1])
+        await self._put("uci")
+        while await self._read_line() != "uciok":
+            pass
+        self._parameters = copy.deepcopy(Stockfish.DEFAULT_PARAMETERS)
+        self._parameters.update(parameters or {})
+        await self._set_options(self._parameters)
+        await self._start_new_game()
+
+    async def __aenter__(self) -> "AsyncStockfish":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.quit()
+
+    """--------------------- PROTOCOL ---------------------"""
+
+    async def _put(self, *commands: str) -> None:
+        if self.engine.stdin is None or self.engine.stdin.is_closing():
+            raise BrokenPipeError()
+        self.engine.stdin.write("".join(f"{command}\n" for command in commands).encode())
+        await self.engine.stdin.drain()
+
+    async def _read_line(self) -> str:
+        line = await self.engine.stdout.readline()
+        if line == b"":
+            raise BrokenPipeError("The engine process has exited")
+        return line.decode().strip()
+
+    async def _read_until(self, first_token: str) -> List[List[str]]:
+        """Returns all lines (split) up to and including the first line starting with `first_token`."""
+        lines = []
+        while True:
+            splitted_text = (await self._read_line()).split(" ")
+            lines.append(splitted_text)
+            if splitted_text[0] == first_token:
+                return lines
+
+    async def _is_ready(self) -> None:
+        await self._put("isready")
+        await self._read_until("readyok")
+
+    async def _set_options(self, options: Dict[str, Any]) -> None:
+        """Sends all `setoption` commands, then waits for a single `readyok`."""
+        await self._put(*[f"setoption name {name} value {value}" for name, value in options.items()])
+        await self._is_ready()
+
+    async def _start_new_game(self) -> None:
+        await self._put("ucinewgame")
+        await self._is_ready()
+        self.info = ""
+
+    async def _run(self, coroutine):
+        """
+        Runs an operation with exclusive use of the engine, within the timeout.
+        An operation stopped in the middle (timeout or cancellation) kills the engine.
+        """
+        async with self._lock:
+            if self.engine.returncode is not None:
+                coroutine.close()
+                raise BrokenPipeError("The engine process has exited")
+            try:
+                return await asyncio.wait_for(coroutine, self.timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                self.engine.kill()
+                await self.engine.wait()
+                raise
+
+    def _set_side_to_move(self, fen_position: Optional[str], moves: List[str]) -> None:
+        white_to_move = fen_position is None or fen_position.split(" ")[1] == "w"
+        self._white_to_move = white_to_move == (len(moves) % 2 == 0)
+
+    def _position_command(self, fen_position: Optional[str], moves: List[str]) -> str:
+        self._set_side_to_move(fen_position, moves)
+        command = "position startpos" if fen_position is None else f"position fen {fen_position}"
+        return f"{command} moves {' '.join(moves)}" if moves else command
+
+    """--------------------- OPERATIONS ---------------------"""
+
+    def set_depth(self, depth_value: int = 2) -> None:
+        self.depth = str(depth_value)
+
+    async def set_parameters(self, parameters: Dict[str, Any]) -> None:
+        async def set_parameters():
+            await self._set_options(parameters)
+            self._parameters.update(parameters)
+        await self._run(set_parameters())
+
+    async def set_position(self, moves: List[str] = None) -> None:
+        """Sets the position reached by `moves` from the initial position, in a new game."""
+        async def set_position():
+            await self._start_new_game()
+            await self._put(self._position_command(None, moves or []))
+        await self._run(set_position())
+
+    async def set_fen_position(self, fen_position: str, moves: List[str] = None) -> None:
+        """Sets the position reached by `moves` from `fen_position`, in a new game."""
+        async def set_fen_position():
+            await self._start_new_game()
+            await self._put(self._position_command(fen_position, moves or []))
+        await self._run(set_fen_position())
+
+    async def get_fen_position(self) -> str:
+        async def get_fen_position():
+            await self._put("d")
+            fen = " ".join((await self._read_until("Fen:"))[-1][1:])
+            # skip the lines after the FEN (key, checkers), which the next command would read
+            await self._is_ready()
+            return fen
+        return await self._run(get_fen_position())
+
+    async def _get_evaluation(self) -> dict:
+        compare = 1 if self._white_to_move else -1
+        evaluation = dict()
+        for splitted_text in await self._read_until("bestmove"):
+            if splitted_text[0] == "info" and "score" in splitted_text:
+                n = splitted_text.index("score")
+                evaluation = {
+                    "type": splitted_text[n + 1],
+                    "value": int(splitted_text[n + 2]) * compare,
+                }
+        return evaluation
+
+    async def get_evaluation(self) -> dict:
+        """Evaluates the current position at `self.depth`. Perspective: White."""
+        async def get_evaluation():
+            await self._put(f"go depth {self.depth}")
+            return await self._get_evaluation()
+        return await self._run(get_evaluation())
+
+    async def evaluate(self, fen_position: str, moves: List[str] = None, depth: int = None) -> dict:
+        """
+        Evaluates the position reached by `moves` from `fen_position`, in a new game,
+        with all commands sent in one write. Perspective: White.
+        """
+        async def evaluate():
+            await self._put(
+                "ucinewgame",
+                "isready",
+                self._position_command(fen_position, moves or []),
+                f"go depth {self.depth if depth is None else depth}",
+            )
+            await self._read_until("readyok")
+            self.info = ""
+            return await self._get_evaluation()
+        return await self._run(evaluate())
+
+    async def next_moves(self) -> List[str]:
+        """Returns the legal moves of the current position."""
+        async def next_moves():
+            await self._put("go perft 1")
+            lines = await self._read_until("Nodes")
+            return [line[0][:-1] for line in lines[:-1] if line[0] != ""]
+        return await self._run(next_moves())
+
+    async def get_top_moves(self, num_top_moves: int = 5) -> List[dict]:
+        """Same as `Stockfish.get_top_moves`, as a coroutine."""
+        if num_top_moves <= 0:
+            raise ValueError("num_top_moves is not a positive number.")
+
+        async def get_top_moves():
+            # parameters may hold numbers as strings
+            old_MultiPV_value = int(self._parameters["MultiPV"])
+            if num_top_moves != old_MultiPV_value:
+                await self._set_options({"MultiPV": num_top_moves})
+            await self._put(f"go depth {self.depth}")
+            lines = await self._read_until("bestmove")
+            multiplier = 1 if self._white_to_move else -1
+
+            top_moves: List[dict] = []
+            if lines[-1][1] != "(none)":
+                for current_line in reversed(lines[:-1]):
+                    if not (
+                        "multipv" in current_line
+                        and "depth" in current_line
+                        and current_line[current_line.index("depth") + 1] == self.depth
+                    ):
+                        break
+                    if int(current_line[current_line.index("multipv") + 1]) > num_top_moves:
+                        continue
+                    score_type = current_line[current_line.index("score") + 1]
+                    value = int(current_line[current_line.index("score") + 2]) * multiplier
+                    top_moves.insert(0, {
+                        "Move": current_line[current_line.index("pv") + 1],
+                        "Centipawn": value if score_type == "cp" else None,
+                        "Mate": value if score_type == "mate" else None,
+                    })
+            if num_top_moves != old_MultiPV_value:
+                await self._set_options({"MultiPV": old_MultiPV_value})
+            return top_moves
+        return await self._run(get_top_moves())
+
+    async def get_best_move_nodes(self, nodes: int = 1000) -> Optional[str]:
+        """Returns the best move of the current position after searching `nodes` nodes."""
+        async def get_best_move_nodes():
+            await self._put(f"go nodes {nodes}")
+            lines = await self._read_until("bestmove")
+            if lines[-1][1] == "(none)":
+                return None
+            self.info = " ".join(lines[-2]) if len(lines) > 1 else ""
+            return lines[-1][1]
+        return await self._run(get_best_move_nodes())
+
+    async def quit(self) -> None:
+        if self.engine.returncode is None:
+            try:
+                await self._put("quit")
+                await asyncio.wait_for(self.engine.wait(), 1)
+            except (BrokenPipeError, ConnectionResetError, asyncio.TimeoutError):
+                self.engine.kill()
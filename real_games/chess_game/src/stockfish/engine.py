@@ -11,13 +11,151 @@ Useful methods:
 This file implements Engine, an extension of Stockfish to fit our use.
 """
 
-from typing import Dict, Optional
+import json
+from typing import Dict, List, Optional
 from real_games.chess_game.src.stockfish.stockfish import Stockfish
+from real_games.eval_cache import EvalCache
 from random import choice
 
+def normalize_fen(fen: str) -> str:
+  """Drop the fullmove number, which does not change the evaluation (the halfmove clock does)"""
+  return ' '.join(fen.split(' ')[:5])
+
 class Engine(Stockfish):
   """ Client to communicate (write and read) with stockfish engine (executable format) """
+
+  # when set, `get_evaluation` reads and writes evaluations there
+  eval_cache: Optional[EvalCache] = None
+  # when set, searches are limited by this number of nodes instead of `depth`
+  nodes: Optional[int] = None
+  # when set, `random_position` reads and writes the top moves of its positions there
+  top_moves_cache: Optional[EvalCache] = None
+  # root (FEN) of the positions searched since the last `ucinewgame`, see `set_sibling_position`
+  hash_root: Optional[str] = None
+
+  def set_nodes(self, nodes: Optional[int]) -> None:
+    """Limit searches to `nodes` nodes (`go nodes`), or to `self.depth` when `nodes` is None"""
+    self.nodes = nodes
+
+  def copy_state_from(self, other: 'Engine') -> None:
+    """Set the search depth, node budget and position of `other` (e.g. a crashed engine being replaced)"""
+    self.set_depth(int(other.depth))
+    self.set_nodes(other.nodes)
+    fen, moves = other._position
+    if fen == 'startpos':
+      self.set_position(moves)
+    else:
+      self.set_fen_position(fen, moves)
+    # fail now if the position kills the engine
+    self._is_ready()
+
+  def set_sibling_position(self, fen: str, moves: List[str] = None) -> None:
+    """
+    Set the position after `moves` from `fen`, keeping the hash (no `ucinewgame`)
+    when the positions searched since the last new game are from the same root `fen`,
+    so that siblings reuse the transpositions of each other's subtrees
+    """
+    self.set_fen_position(fen, moves, send_ucinewgame_token=self.hash_root != fen)
+    self.hash_root = fen
+
+  def _start_new_game(self) -> None:
+    super()._start_new_game()
+    self.hash_root = None
+
+  def _go(self) -> None:
+    if self.nodes is None:
+      super()._go()
+    else:
+      self._go_nodes(self.nodes)
+
+  def _position_key(self) -> str:
+    """
+    Cache key of the current position: the FEN it was set from and its moves, without asking the engine.
+    Positions reached by moves from the initial position are keyed by their FEN, asked to the engine,
+    so that random positions reached by other moves have the same key.
+    """
+    fen, moves = self._position
+    if fen == 'startpos':
+      return normalize_fen(self.get_fen_position())
+    return ' '.join([normalize_fen(fen)] + (['moves'] + moves if moves else []))
+
+  def _eval_key(self) -> str:
+    """Cache key of a search of the current position: its position key, depth (or nodes) and engine options"""
+    fen = self._position_key()
+    options = json.dumps(self._parameters, sort_keys=True)
+    version = getattr(self, '_stockfish_major_version', None)
+    search = f'depth {self.depth}' if self.nodes is None else f'nodes {self.nodes}'
+    if self.hash_root is not None:
+      # the score may depend on the searches of the siblings
+      search += ' keep hash'
+    return f'{fen}|{search}|{options}|version {version}'
+
+  def get_generation_top_moves(self, num_top_moves: int) -> List[Dict]:
+    """
+    Same as `get_top_moves`, through `top_moves_cache` when it is set,
+    without setting MultiPV back (see `random_position`)
+    """
+    if self.top_moves_cache is None:
+      return self.get_top_moves(num_top_moves, restore_multipv=False)
+    options = {name: value for name, value in self._parameters.items() if name != 'MultiPV'}
+    version = getattr(self, '_stockfish_major_version', None)
+    key = f'{self._position_key()}|top {num_top_moves}|depth {self.depth}|' \
+      f'{json.dumps(options, sort_keys=True)}|version {version}'
+    top_moves = self.top_moves_cache.get(key)
+    if top_moves is None:
+      top_moves = self.get_top_moves(num_top_moves, restore_multipv=False)
+      self.top_moves_cache.put(key, top_moves)
+    return top_moves
+
+  def get_evaluation(self) -> Dict:
+    """Same as Stockfish.get_evaluation, through `eval_cache` when it is set"""
+    if self.eval_cache is None:
+      return super().get_evaluation()
+    key = self._eval_key()
+    evaluation = self.eval_cache.get(key)
+    if evaluation is None:
+      evaluation = super().get_evaluation()
+      self.eval_cache.put(key, evaluation)
+    return evaluation
       
+  def get_evaluations_by_depth(self) -> Dict[int, Dict]:
+    """
+    Search the current position like `get_evaluation`, and return the evaluation of every depth
+    of the iterative deepening (depth -> {type, value}, perspective: White), through `eval_cache` when it is set.
+    The evaluation at depth `k` is the one a search of depth `k` would return.
+    """
+    if self.eval_cache is None:
+      return self._search_by_depth()
+    key = self._eval_key() + '|by depth'
+    evaluations = self.eval_cache.get(key)
+    if evaluations is None:
+      evaluations = self._search_by_depth()
+      self.eval_cache.put(key, evaluations)
+    # JSON keys are strings
+    return {int(depth): evaluation for depth, evaluation in evaluations.items()}
+
+  def _search_by_depth(self) -> Dict[int, Dict]:
+    multiplier = 1 if self._white_to_move else -1
+    evaluations, exact = {}, set()
+    self._go()
+    while True:
+      text = self._read_line()
+      tokens = text.split(' ')
+      if tokens[0] == 'bestmove':
+        return evaluations
+      if tokens[0] != 'info' or 'depth' not in tokens or 'score' not in tokens:
+        continue
+      self.info = text
+      depth = int(tokens[tokens.index('depth') + 1])
+      # a bound (fail high / low) is only kept until the exact score of its depth
+      bound = 'lowerbound' in tokens or 'upperbound' in tokens
+      if bound and depth in exact:
+        continue
+      score = tokens.index('score')
+      evaluations[depth] = {'type': tokens[score + 1], 'value': int(tokens[score + 2]) * multiplier}
+      if not bound:
+        exact.add(depth)
+
   def get_eval_pos(self, position):
     """
       Retuns: (object) evaluation of the current position in centipawns
@@ -28,6 +166,30 @@ class Engine(Stockfish):
     self.set_position(position)
     return self.get_evaluation()
 
+  def get_children_evaluations(self, moves: List[str]) -> Dict[str, Dict]:
+    """
+      Evaluate the children reached by `moves` from the current position with a single search
+      at the root with MultiPV = len(moves): the line of each move is the evaluation of its child,
+      searched 1 ply less deep than the root (self.depth).
+
+      Returns: move -> evaluation (same format as get_evaluation, perspective: White),
+      for the moves reported by the engine
+    """
+    if len(moves) == 0:
+      return {}
+    multiplier = 1 if self._white_to_move else -1
+    evaluations = {}
+    for top_move in self.get_top_moves(len(moves)):
+      if top_move['Mate'] is None:
+        evaluations[top_move['Move']] = {'type': 'cp', 'value': top_move['Centipawn']}
+      else:
+        mate = top_move['Mate']
+        if mate * multiplier > 0:
+          # the side to move mates in `mate` moves, including the move to the child
+          mate -= multiplier
+        evaluations[top_move['Move']] = {'type': 'mate', 'value': mate}
+    return evaluations
+
   def next_moves(self):
     """ Return: a list of string as legal moves of the current position"""
     self._put("go perft 1")
@@ -54,32 +216,40 @@ class Engine(Stockfish):
     Return: a random position at the specified depth
     
     The game will be set to the resulted position.
+    MultiPV stays at `n_top_moves` while generating (and top moves go through `top_moves_cache`).
     """
     depth += int(has_children)
     
-    old_depth = self.depth
+    old_depth, old_nodes, old_multipv = self.depth, self.nodes, self._parameters['MultiPV']
     self.set_depth(generation_search_depth)
+    self.set_nodes(None)
     # ^ Temporarily set search depth to this number (for faster running time)
 
-    while True:
-      moves = []
-      success = True
-      
-      for _ in range(depth):
-        self.set_position(moves) 
-        # pick a random move from either (1) legal moves or (2) some best moves
-        try:
-          next_move = (choice(self.next_moves()) if n_top_moves == 0 \
-            else choice(self.get_top_moves(n_top_moves))["Move"])
-        except IndexError: # no moves next
-          success = False
-          break
+    try:
+      while True:
+        moves = []
+        success = True
+        
+        for _ in range(depth):
+          self.set_position(moves) 
+          # pick a random move from either (1) legal moves or (2) some best moves
+          try:
+            next_move = (choice(self.next_moves()) if n_top_moves == 0 \
+              else choice(self.get_generation_top_moves(n_top_moves))["Move"])
+          except IndexError: # no moves next
+            success = False
+            break
 
-        moves.append(next_move)
-      
-      if success:
-        break
-    self.set_depth(old_depth)
+          moves.append(next_move)
+        
+        if success:
+          break
+    finally:
+      self.set_depth(old_depth)
+      self.set_nodes(old_nodes)
+      if self._parameters['MultiPV'] != old_multipv:
+        self._set_option('MultiPV', old_multipv)
+        self._parameters.update({'MultiPV': old_multipv})
  
     if has_children:
       moves = moves[:-1]
@@ -5,7 +5,7 @@
 """
 
 import subprocess
-from typing import Any, List, Optional
+from typing import Any, List, Optional, Tuple
 import copy
 from os.path import join
 from sys import platform
@@ -13,34 +13,36 @@ from sys import platform
 class Stockfish:
     """Integrates the Stockfish chess engine with Python."""
 
+    # Set default params to reproduce Stockfish 13
+    # Unknown param: `Analysis Contempt`
+    DEFAULT_PARAMETERS = {
+        "Debug Log File": "",
+        "Contempt": "24",
+        "Threads": "1",
+        "Hash": "16",
+        "Clear Hash Ponder": "false",
+        "MultiPV": "1",
+        "Skill Level": "20",
+        "Move Overhead": "10",
+        "Slow Mover": "100",
+        "nodestime": "0",
+        "UCI_Chess960": "false",
+        "UCI_AnalyseMode": "false",
+        "UCI_LimitStrength": "false",
+        "UCI_Elo": "1350",
+        "UCI_ShowWDL": "false",
+        "SyzygyPath": "",
+        "SyzygyProbeDepth": "1",
+        "Syzygy50MoveRule": "true",
+        "SyzygyProbeLimit": "7",
+        "Use NNUE": "false",
+        "EvalFile": "nn-62ef826d1a6d.nnue"
+    }
+
     def __init__(
         self, path: str = None, depth: int = 2, parameters: dict = None
     ) -> None:
-        # Set default params to reproduce Stockfish 13
-        # Unknown param: `Analysis Contempt`
-        self.default_stockfish_params = {
-            "Debug Log File": "",
-            "Contempt": "24",
-            "Threads": "1",
-            "Hash": "16",
-            "Clear Hash Ponder": "false",
-            "MultiPV": "1",
-            "Skill Level": "20",
-            "Move Overhead": "10",
-            "Slow Mover": "100",
-            "nodestime": "0",
-            "UCI_Chess960": "false",
-            "UCI_AnalyseMode": "false",
-            "UCI_LimitStrength": "false",
-            "UCI_Elo": "1350",
-            "UCI_ShowWDL": "false",
-            "SyzygyPath": "",
-            "SyzygyProbeDepth": "1",
-            "Syzygy50MoveRule": "true",
-            "SyzygyProbeLimit": "7",
-            "Use NNUE": "false",
-            "EvalFile": "nn-62ef826d1a6d.nnue"
-        }
+        self.default_stockfish_params = copy.deepcopy(self.DEFAULT_PARAMETERS)
         
         is_stockfish = False
         if path is None:
@@ -63,6 +65,10 @@ class Stockfish:
 
         self.depth = str(depth)
         self.info: str = ""
+        # side to move of the current position, tracked locally to avoid asking the engine (`d`)
+        self._white_to_move = True
+        # current position as (FEN or "startpos", moves)
+        self._position: Tuple[str, List[str]] = ("startpos", [])
         
         if True:
             if parameters is None:
@@ -106,7 +112,11 @@ class Stockfish:
     def _read_line(self) -> str:
         if not self.engine.stdout:
             raise BrokenPipeError()
-        return self.engine.stdout.readline().strip()
+        line = self.engine.stdout.readline()
+        if line == "":
+            # end of file: every line read from a live engine ends with a newline
+            raise BrokenPipeError("The engine process has exited")
+        return line.strip()
 
     def _set_option(self, name: str, value: Any) -> None:
         self._put(f"setoption name {name} value {value}")
@@ -143,6 +153,8 @@ class Stockfish:
         if moves is None:
             moves = []
         self._put(f"position startpos moves {self._convert_move_list_to_str(moves)}")
+        self._white_to_move = len(moves) % 2 == 0
+        self._position = ("startpos", list(moves))
 
     def get_board_visual(self) -> str:
         """Returns a visual representation of the current board position.
@@ -169,6 +181,8 @@ class Stockfish:
             text = self._read_line()
             splitted_text = text.split(" ")
             if splitted_text[0] == "Fen:":
+                # skip the lines after the FEN (key, checkers), which the next command would read
+                self._is_ready()
                 return " ".join(splitted_text[1:])
 
     def set_skill_level(self, skill_level: int = 20) -> None:
@@ -194,16 +208,29 @@ class Stockfish:
         self._set_option("UCI_Elo", elo_rating)
         self._parameters.update({"UCI_Elo": elo_rating})
 
-    def set_fen_position(self, fen_position: str) -> None:
+    def set_fen_position(
+        self, fen_position: str, moves: List[str] = None, send_ucinewgame_token: bool = True
+    ) -> None:
         """Sets current board position in Forsyth–Edwards notation (FEN).
         Args:
             fen_position:
               FEN string of board position.
+            moves:
+              Moves to play from that position, in full algebraic notation.
+            send_ucinewgame_token:
+              Whether to start a new game (`ucinewgame`, which clears the hash) first.
         Returns:
             None
         """
-        self._start_new_game()
-        self._put(f"position fen {fen_position}")
+        if send_ucinewgame_token:
+            self._start_new_game()
+        if moves:
+            self._put(f"position fen {fen_position} moves {self._convert_move_list_to_str(moves)}")
+        else:
+            self._put(f"position fen {fen_position}")
+        white_to_move = fen_position.split(" ")[1] == "w"
+        self._white_to_move = white_to_move == (len(moves or []) % 2 == 0)
+        self._position = (fen_position, list(moves or []))
 
     def get_best_move(self) -> Optional[str]:
         """Returns best move with current position on the board.
@@ -269,12 +296,10 @@ class Stockfish:
         """
 
         evaluation = dict()
-        fen_position = self.get_fen_position()
-        if "w" in fen_position:  # w can only be in FEN if it is whites move
+        if self._white_to_move:
             compare = 1
         else:  # stockfish shows advantage relative to current player, convention is to do white positive
             compare = -1
-        self._put(f"position {fen_position}")
         self._go()
         while True:
             text = self._read_line()
@@ -282,6 +307,7 @@ class Stockfish:
             if splitted_text[0] == "info":
                 for n in range(len(splitted_text)):
                     if splitted_text[n] == "score":
+                        self.info = text
                         evaluation = {
                             "type": splitted_text[n + 1],
                             "value": int(splitted_text[n + 2]) * compare,
@@ -289,12 +315,39 @@ class Stockfish:
             elif splitted_text[0] == "bestmove":
                 return evaluation
 
-    def get_top_moves(self, num_top_moves: int = 5) -> List[dict]:
+    def get_static_eval(self) -> Optional[dict]:
+        """Evaluates current position without search (`eval` command)
+        Returns:
+            A dictionary with "type" "cp" (centipawns) and "value", or None when
+            the side to move is in check (Stockfish has no static eval then)
+            Key: type, value
+            Perspective: White
+        """
+        self._put("eval")
+        # the output of `eval` has no last line of its own
+        self._put("isready")
+        evaluation = None
+        while True:
+            text = self._read_line()
+            if text == "readyok":
+                return evaluation
+            # e.g. `Final evaluation       +0.12 (white side) [with scaled NNUE, ...]`,
+            # `Final evaluation: none (in check)`, `Total Evaluation: 0.12 (white side)` (older versions)
+            if text.startswith("Final evaluation") or text.startswith("Total Evaluation"):
+                value = text.split()[2]
+                if value != "none":
+                    # in pawns, from the perspective of White like `get_evaluation`
+                    evaluation = {"type": "cp", "value": round(float(value) * 100)}
+
+    def get_top_moves(self, num_top_moves: int = 5, restore_multipv: bool = True) -> List[dict]:
         """Returns info on the top moves in the position.
         Args:
             num_top_moves:
                 The number of moves to return info on, assuming there are at least
                 those many legal moves.
+            restore_multipv:
+                Whether to set MultiPV back to its previous value (`setoption` + `isready`),
+                otherwise it stays at `num_top_moves` for the next calls.
         Returns:
             A list of dictionaries. In each dictionary, there are keys for Move, Centipawn, and Mate;
             the corresponding value for either the Centipawn or Mate key will be None.
@@ -316,7 +369,7 @@ class Stockfish:
             if splitted_text[0] == "bestmove":
                 break
         top_moves: List[dict] = []
-        multiplier = 1 if ("w" in self.get_fen_position()) else -1
+        multiplier = 1 if self._white_to_move else -1
         for current_line in reversed(lines):
             if current_line[0] == "bestmove":
                 if current_line[1] == "(none)":
@@ -351,7 +404,7 @@ class Stockfish:
                     )
             else:
                 break
-        if old_MultiPV_value != self._parameters["MultiPV"]:
+        if restore_multipv and old_MultiPV_value != self._parameters["MultiPV"]:
             self._set_option("MultiPV", old_MultiPV_value)
             self._parameters.update({"MultiPV": old_MultiPV_value})
         return top_moves
@@ -372,5 +425,11 @@ class Stockfish:
         return self._stockfish_major_version
 
     def __del__(self) -> None:
-        self._put("quit")
+        if getattr(self, "engine", None) is None:
+            return  # the process was never started
+        if self.engine.poll() is None:
+            try:
+                self._put("quit")
+            except (BrokenPipeError, ValueError):
+                pass  # the pipe is broken or already closed
         self.engine.kill()
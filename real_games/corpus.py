@@ -0,0 +1,156 @@
+"""
+Corpus of distinct random positions, generated once and assessed by many runs
+
+Positions are stored in a SQLite file with the parameters of their generation
+(position depth, no. top moves, depth of the top-move search), without duplicates:
+chess positions are compared by FEN (without the move counters),
+Othello positions by board in canonical form (the 8 symmetric boards are the same) and side to move.
+
+  python -m real_games.corpus build chess chess-corpus.db --n-positions 1000 --position-depth 20
+  python -m real_games.corpus summary chess-corpus.db
+  python -m real_games.chess_game.src.main criticality chess criticality --corpus chess-corpus.db \\
+    --n-positions 1000 --position-depth 20
+
+Runs with `--corpus` assess the first `--n-positions` positions generated with their parameters,
+so runs with other search depths assess the same positions. Several builds can add to one file at the same time.
+"""
+
+import json
+import sqlite3
+import threading
+from typing import Dict, List
+import click
+from real_games.benchmark import GAMES
+
+# generation parameters of a position, in the order of the columns
+PARAMETERS = ('position_depth', 'n_top_moves', 'generation_search_depth')
+
+
+def _chess_key(position: Dict) -> str:
+  from real_games.chess_game.src.stockfish.engine import normalize_fen
+  return normalize_fen(position['fen'])
+
+
+def _othello_key(position: Dict) -> str:
+  from real_games.othello.src.bitboard import Board, canonical
+  board = Board.from_moves(position['moves'])
+  player, opponent = canonical(board.player, board.opponent)
+  return f'{"black" if board.black_to_move else "white"} {player:016x} {opponent:016x}'
+
+
+KEYS = {'chess': _chess_key, 'othello': _othello_key}
+
+
+class PositionCorpus:
+  """Positions of the SQLite file `path`, by game and generation parameters (`PARAMETERS`)"""
+  def __init__(self, path: str):
+    self.path = path
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False, timeout=60)
+    self.connection.execute('PRAGMA journal_mode=WAL')
+    self.connection.execute(
+      'CREATE TABLE IF NOT EXISTS positions (id INTEGER PRIMARY KEY AUTOINCREMENT, game TEXT NOT NULL, '
+      'position_depth INTEGER NOT NULL, n_top_moves INTEGER NOT NULL, generation_search_depth INTEGER NOT NULL, '
+      'key TEXT NOT NULL, position TEXT NOT NULL, '
+      'UNIQUE (game, position_depth, n_top_moves, generation_search_depth, key))')
+    self.connection.commit()
+
+  def add(self, game: str, parameters: Dict, position: Dict) -> bool:
+    """Add `position`, return whether it is new for `game` and `parameters`"""
+    with self.lock:
+      cursor = self.connection.execute(
+        'INSERT OR IGNORE INTO positions (game, position_depth, n_top_moves, generation_search_depth, key, position) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        (game, *(parameters[name] for name in PARAMETERS), KEYS[game](position), json.dumps(position)))
+      self.connection.commit()
+      return cursor.rowcount == 1
+
+  def count(self, game: str, parameters: Dict) -> int:
+    with self.lock:
+      return self.connection.execute(
+        'SELECT COUNT(*) FROM positions WHERE game = ? AND position_depth = ? AND n_top_moves = ? '
+        'AND generation_search_depth = ?', (game, *(parameters[name] for name in PARAMETERS))).fetchone()[0]
+
+  def positions(self, game: str, parameters: Dict, offset: int = 0, limit: int = -1) -> List[Dict]:
+    """Positions of `game` generated with `parameters`, in the order they were added"""
+    with self.lock:
+      rows = self.connection.execute(
+        'SELECT position FROM positions WHERE game = ? AND position_depth = ? AND n_top_moves = ? '
+        'AND generation_search_depth = ? ORDER BY id LIMIT ? OFFSET ?',
+        (game, *(parameters[name] for name in PARAMETERS), limit, offset)).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+  def summary(self) -> List[tuple]:
+    """Rows of game, generation parameters and no. positions"""
+    with self.lock:
+      return self.connection.execute(
+        'SELECT game, position_depth, n_top_moves, generation_search_depth, COUNT(*) FROM positions '
+        'GROUP BY game, position_depth, n_top_moves, generation_search_depth').fetchall()
+
+  def close(self) -> None:
+    with self.lock:
+      self.connection.close()
+
+
+def corpus_positions(path: str, game: str, parameters: Dict, n_positions: int) -> List[Dict]:
+  """The first `n_positions` positions of the corpus `path`, for `--corpus` (which fails when there are not enough)"""
+  corpus = PositionCorpus(path)
+  positions = corpus.positions(game, parameters, limit=n_positions)
+  corpus.close()
+  if len(positions) < n_positions:
+    options = ' '.join(f'--{name.replace("_", "-")} {parameters[name]}' for name in PARAMETERS)
+    raise click.BadParameter(f'{path} has {len(positions)} {game} positions for {options}, not {n_positions}: '
+      f'add some with `python -m real_games.corpus build {game} {path} --n-positions {n_positions} {options}`')
+  return positions
+
+
+@click.group()
+def cli():
+  pass
+
+
+@cli.command()
+@click.argument('game', type=click.Choice(list(GAMES)))
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option('--n-positions', type=int, default=100, help='No. distinct positions the corpus should have')
+@click.option('--position-depth', type=int, default=20, help='Depth of generated positions')
+@click.option('--n-top-moves', type=int, default=0, \
+  help='No. top moves to choose at each turn when generating positions (0: purely random games)')
+@click.option('--generation-search-depth', type=int, default=10, \
+  help='Depth of top-move search for position generation')
+@click.option('--max-duplicates', type=int, default=1000, \
+  help='Stop after this many duplicates in a row (there may be few distinct positions at small depths)')
+def build(game, path, n_positions, position_depth, n_top_moves, generation_search_depth, max_duplicates):
+  """Generate positions into the corpus PATH until it has N_POSITIONS distinct ones for the parameters"""
+  parameters = dict(position_depth=position_depth, n_top_moves=n_top_moves, \
+    generation_search_depth=generation_search_depth)
+  corpus = PositionCorpus(path)
+  create_engine, _ = GAMES[game]()
+  engine = create_engine({})
+  count, duplicates = corpus.count(game, parameters), 0
+  while count < n_positions and duplicates < max_duplicates:
+    position = engine.random_position(position_depth, n_top_moves, \
+      generation_search_depth=generation_search_depth, has_children=True)
+    if corpus.add(game, parameters, position):
+      count, duplicates = count + 1, 0
+      print(f'Position {count}/{n_positions}')
+    else:
+      duplicates += 1
+  if count < n_positions:
+    print(f'Stopped after {max_duplicates} duplicates in a row: {count} distinct positions')
+  corpus.close()
+
+
+@cli.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def summary(path):
+  """Print the number of positions of the corpus PATH by game and generation parameters"""
+  corpus = PositionCorpus(path)
+  for game, position_depth, n_top_moves, generation_search_depth, count in corpus.summary():
+    print(f'{game}: {count} positions (position depth {position_depth}, {n_top_moves} top moves, '
+      f'generation search depth {generation_search_depth})')
+  corpus.close()
+
+
+if __name__ == '__main__':
+  cli()
@@ -0,0 +1,165 @@
+"""
+Run independent engine evaluations concurrently on a pool of engine processes
+
+Engines can be supervised: a dead engine process surfaces as a `BrokenPipeError`
+(end of its output, or a write into a closed pipe), and a hung one is killed after a timeout,
+which turns the hang into the same error. The engine is then replaced by a new one
+with the options of `create_engine` and the depth and position of the old one,
+and its task runs again. Tasks set their own position and search first, so a retry gives the same result.
+"""
+
+import queue
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict
+from real_games.utils import BufferLogger, Logger
+
+
+def completed(result) -> Future:
+  """A Future already holding `result`"""
+  future = Future()
+  future.set_result(result)
+  return future
+
+
+class Supervisor:
+  """
+  Engine created by `create_engine`, restarted up to `retries` times in a row when its process dies.
+
+  `run(task, *args)` runs `task(engine, *args)`, `submit` does the same and returns a Future,
+  so a supervisor can be the executor of the assess functions (like `SerialExecutor`).
+  With `timeout`, a task waiting more than `timeout` seconds for the engine kills its process.
+  """
+  def __init__(self, create_engine: Callable, timeout: float = None, retries: int = 2):
+    self.create_engine = create_engine
+    self.timeout = timeout
+    self.retries = retries
+    self.engine = create_engine()
+    self.restarts = 0
+
+  def _kill(self, process: subprocess.Popen) -> None:
+    print(f'Engine timed out after {self.timeout} seconds, killing it')
+    process.kill()
+
+  def _restart(self, error: Exception) -> None:
+    print(f'Engine failed ({error!r}), restarting it')
+    engine = self.create_engine()
+    try:
+      engine.copy_state_from(self.engine)
+    except (BrokenPipeError, ValueError):
+      # the position itself may kill the engine: keep a fresh one
+      engine = self.create_engine()
+    self.engine = engine
+    self.restarts += 1
+
+  def _is_dead(self, engine) -> bool:
+    try:
+      engine.engine.wait(timeout=1)
+      return True
+    except subprocess.TimeoutExpired:
+      return False
+
+  def run(self, task: Callable, *args):
+    for attempt in range(self.retries + 1):
+      engine = self.engine
+      timer = None
+      if self.timeout is not None:
+        timer = threading.Timer(self.timeout, self._kill, (engine.engine,))
+        timer.daemon = True
+        timer.start()
+      try:
+        return task(engine, *args)
+      except (BrokenPipeError, ValueError) as error:
+        # ValueError: I/O on a pipe closed while the process was killed
+        if attempt == self.retries or not self._is_dead(engine):
+          raise
+        self._restart(error)
+      finally:
+        if timer is not None:
+          timer.cancel()
+
+  def submit(self, task: Callable, *args) -> Future:
+    return completed(self.run(task, *args))
+
+  def close(self) -> None:
+    """Stop the engine process"""
+    self.engine.engine.kill()
+
+
+class EnginePool:
+  """
+  Pool of `size` engines, each used by one task at a time.
+
+  `submit(task, *args)` runs `task(engine, *args)` on an idle engine and returns a Future.
+  Engines talk to their processes through pipes, which release the GIL,
+  so one thread per engine is enough to keep all of them busy.
+  Every engine is supervised (see `Supervisor`), with `timeout` and `retries`.
+  With `create_runner`, tasks run on its results instead, which have the `run` and `close` methods
+  of a `Supervisor` (e.g. leases on an engine server, see `real_games.engine_server`).
+  """
+  def __init__(self, create_engine: Callable, size: int, timeout: float = None, retries: int = 0, \
+    create_runner: Callable = None):
+    self.size = size
+    create_runner = create_runner or (lambda: Supervisor(create_engine, timeout, retries))
+    self.runners = [create_runner() for _ in range(size)]
+    self.idle = queue.Queue()
+    for runner in self.runners:
+      self.idle.put(runner)
+    self.executor = ThreadPoolExecutor(max_workers=size)
+
+  def _run(self, task: Callable, *args):
+    runner = self.idle.get()
+    try:
+      return runner.run(task, *args)
+    finally:
+      self.idle.put(runner)
+
+  def submit(self, task: Callable, *args) -> Future:
+    return self.executor.submit(self._run, task, *args)
+
+  def close(self) -> None:
+    self.executor.shutdown()
+    for runner in self.runners:
+      runner.close()
+    self.runners = []
+
+
+class SerialExecutor:
+  """Same interface as EnginePool, running every task right away on a single engine"""
+  def __init__(self, engine):
+    self.engine = engine
+
+  def submit(self, task: Callable, *args) -> Future:
+    return completed(task(self.engine, *args))
+
+
+def assess_concurrently(generate: Callable[[], Dict], assess: Callable, logger: Logger, \
+  pool: EnginePool, n_positions: int, search_depth: int) -> None:
+  """
+  Generate `n_positions` positions with `generate` and assess them on `pool`.
+
+  Several positions are assessed at the same time while the next ones are generated.
+  Each assessment writes into its own buffer, and buffers are written into `logger`
+  in the order of the positions, so the log is the same as a serial run.
+  """
+  pending = deque()
+
+  def flush(keep: int) -> None:
+    """Log the finished positions in order, waiting for the oldest ones until at most `keep` are left"""
+    while pending and (len(pending) > keep or pending[0][1].done()):
+      buffer, future = pending.popleft()
+      future.result()
+      buffer.flush_to(logger)
+      logger.end_position()
+
+  # positions in flight are bounded by the pool size: the next one is generated once one is logged
+  with ThreadPoolExecutor(max_workers=pool.size) as coordinators:
+    for i in range(n_positions):
+      flush(keep=pool.size - 1)
+      position = generate()
+      print(f'Position {i+1}/{n_positions}')
+      buffer = BufferLogger()
+      pending.append((buffer, coordinators.submit(assess, None, buffer, position, search_depth, pool)))
+    flush(keep=0)
@@ -0,0 +1,224 @@
+"""
+Long-lived engine server, shared by the real-game jobs of a machine
+
+Starting an engine (e.g. Stockfish options, each followed by `isready`, or the Edax book) takes
+a noticeable part of short jobs. The server keeps warm, configured engines and serves jobs over a Unix socket:
+
+  python -m real_games.engine_server chess --socket chess-engines.sock --size 4 --engine-config chess-engines.json
+  python -m real_games.chess_game.src.main criticality chess criticality --engine-server chess-engines.sock
+
+Every connection leases one engine until it closes, so the position and search settings of an engine
+belong to a single client at a time; a released engine is reset (new game, default depth).
+The server first sends its number of engines, so that a job needing more leases than that
+fails right away (`check_leases`) instead of waiting forever for its own leases.
+A client sends tasks `task(engine, *args)`, where `task` is a module-level function
+(or a partial of one), pickled by reference, and gets back their results or exceptions.
+`EngineClient` has the interface of `Supervisor` (`run`, `submit`), so it can be an assess executor
+or a runner of an `EnginePool`. Engines of the server are supervised, and use its eval cache if any.
+Random positions generated by the server use its own random state, not the client's.
+Only jobs of the user running the server can connect: the socket and the key that clients
+must present (`<socket>.key`, written by the server) are readable by that user only.
+"""
+
+import os
+import queue
+import signal
+import threading
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import Callable
+import click
+from real_games.benchmark import GAMES, load_engine_config
+from real_games.engine_pool import Supervisor, completed
+from real_games.eval_cache import EvalCache
+
+
+def _reset_chess(engine) -> None:
+  """New game at the initial position, with the default depth of the engine and no node budget"""
+  engine.set_nodes(None)
+  engine.set_depth(2)
+  engine.set_position([])
+
+
+def _reset_othello(engine) -> None:
+  """Initial position, with the default level of the engine"""
+  if engine.depth != 20:
+    engine.set_depth(20)
+  engine.set_position('')
+
+
+RESETS = {'chess': _reset_chess, 'othello': _reset_othello}
+
+
+def key_path(address: str) -> str:
+  """Path of the key that clients of the server on `address` authenticate with"""
+  return f'{address}.key'
+
+
+def _connect(address: str):
+  with open(key_path(address), 'rb') as file:
+    authkey = file.read()
+  return Client(address, family='AF_UNIX', authkey=authkey)
+
+
+def _write_key(address: str) -> bytes:
+  """Write a new random key for the server on `address`, readable by this user only"""
+  authkey = os.urandom(32)
+  fd = os.open(key_path(address), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+  with os.fdopen(fd, 'wb') as file:
+    os.fchmod(fd, 0o600) # an older key file may have other permissions
+    file.write(authkey)
+  return authkey
+
+
+class EngineClient:
+  """Lease of an engine of the server listening on `address`, held until `close()`"""
+  def __init__(self, address: str):
+    self.connection = _connect(address)
+    self.size = self.connection.recv()
+    self.connection.send('lease')
+    # the server answers once an engine is free
+    if not self.connection.poll(1):
+      print(f'Waiting for an engine of {address}')
+    self.connection.recv()
+
+  def run(self, task: Callable, *args):
+    self.connection.send((task, args))
+    success, result = self.connection.recv()
+    if not success:
+      raise result
+    return result
+
+  def submit(self, task: Callable, *args) -> Future:
+    return completed(self.run(task, *args))
+
+  def close(self) -> None:
+    self.connection.close()
+
+
+def server_size(address: str) -> int:
+  """No. engines of the server listening on `address`, i.e. of leases it can hold at the same time"""
+  connection = _connect(address)
+  size = connection.recv()
+  connection.close()
+  return size
+
+
+def check_leases(address: str, n_leases: int) -> None:
+  """Fail when a job needs more leases at the same time than the server on `address` has engines"""
+  size = server_size(address)
+  if n_leases > size:
+    raise click.BadParameter(f'The job needs {n_leases} engines at the same time and {address} has {size}: '
+      f'start the server with --size {n_leases} or more, or use fewer engines')
+
+
+def serve(address: str, supervisors: 'queue.Queue[Supervisor]', reset: Callable) -> None:
+  """Lease the engines of `supervisors` to the clients of `address`, until interrupted"""
+  size = supervisors.qsize()
+
+  def handle(connection) -> None:
+    try:
+      connection.send(size)
+      connection.recv() # lease request
+    except (EOFError, OSError): # a size query (see `server_size`)
+      connection.close()
+      return
+    supervisor = supervisors.get()
+    try:
+      try:
+        connection.send('ready')
+      except OSError: # the client stopped waiting
+        return
+      while True:
+        try:
+          task, args = connection.recv()
+        except (EOFError, OSError): # the client closed the connection, or died
+          break
+        try:
+          connection.send((True, supervisor.run(task, *args)))
+        except Exception as error: # pylint: disable=broad-except
+          try:
+            connection.send((False, error))
+          except Exception: # pylint: disable=broad-except
+            # the error cannot be pickled
+            connection.send((False, RuntimeError(repr(error))))
+    finally:
+      connection.close()
+      try:
+        supervisor.run(reset)
+      except Exception as error: # pylint: disable=broad-except
+        # e.g. a dead engine after its restarts: replace it, so that the server keeps its size
+        print(f'Engine could not be reset ({error!r}), replacing it')
+        supervisor.close()
+        supervisor = Supervisor(supervisor.create_engine, supervisor.timeout, supervisor.retries)
+      finally:
+        supervisors.put(supervisor)
+
+  # `kill` stops the server like Ctrl-C, which removes the socket
+  signal.signal(signal.SIGTERM, signal.default_int_handler)
+  authkey = _write_key(address)
+  # the socket is created accessible to this user only, there is no window before a chmod
+  umask = os.umask(0o177)
+  try:
+    listener = Listener(address, family='AF_UNIX', authkey=authkey)
+  finally:
+    os.umask(umask)
+  print(f'Serving {size} engines on {address}')
+  try:
+    while True:
+      try:
+        connection = listener.accept()
+      except (AuthenticationError, EOFError, ConnectionError) as error: # not a job of this server
+        print(f'Refused a connection ({error!r})')
+        continue
+      threading.Thread(target=handle, args=(connection,), daemon=True).start()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    listener.close()
+    os.remove(key_path(address))
+
+
+@click.command()
+@click.argument('game', type=click.Choice(list(GAMES)))
+@click.option('--socket', 'address', type=click.Path(dir_okay=False), default=None, \
+  help='Path of the Unix socket (default: <game>-engines.sock)')
+@click.option('--size', type=int, default=None, \
+  help='No. engines, i.e. of concurrent leases (default: from --engine-config, or 1)')
+@click.option('--engine-config', type=click.Path(exists=True, dir_okay=False), default=None, \
+  help='JSON file written by `python -m real_games.benchmark`: engine options and no. engines')
+@click.option('--eval-cache', type=click.Path(dir_okay=False), default=None, \
+  help='SQLite file caching the evaluations of the engines (disabled by default)')
+@click.option('--engine-timeout', type=float, default=None, \
+  help='Seconds an engine may take to answer before it is killed and restarted (default: no limit)')
+@click.option('--engine-retries', type=int, default=2, \
+  help='No. times an engine is restarted in a row after dying or timing out, before the task fails')
+def main(game, address, size, engine_config, eval_cache, engine_timeout, engine_retries):
+  address = address or f'{game}-engines.sock'
+  if os.path.exists(address):
+    raise click.UsageError(f'{address} exists: another server is running, or remove it')
+  options = {}
+  if engine_config is not None:
+    engine_config = load_engine_config(engine_config, game)
+    options = engine_config['options']
+    size = size or engine_config['n_engines']
+  if eval_cache is not None:
+    eval_cache = EvalCache(eval_cache)
+  create_game_engine, _ = GAMES[game]()
+
+  def create_engine():
+    engine = create_game_engine(options)
+    engine.eval_cache = eval_cache
+    return engine
+
+  supervisors = queue.Queue()
+  for _ in range(size or 1):
+    supervisors.put(Supervisor(create_engine, engine_timeout, engine_retries))
+  serve(address, supervisors, RESETS[game])
+  if eval_cache is not None:
+    eval_cache.close()
+
+
+if __name__ == '__main__':
+  main()
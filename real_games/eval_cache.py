@@ -0,0 +1,79 @@
+"""
+On-disk cache of engine evaluations, shared by runs and by the engines of a pool.
+
+Evaluations are stored in a SQLite database as `key -> evaluation`,
+where the key identifies the position, the search and the engine options
+(see the engines using it) and the evaluation is a dict such as `{type: "cp", value: 30}`.
+Hits and misses are counted per run, and added to the totals stored in the database on `close()`.
+"""
+
+import json
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+
+class EvalCache:
+  """Thread-safe key-value store of evaluations in the SQLite file `path`, called `name` in messages"""
+  def __init__(self, path: str, name: str = 'Eval cache'):
+    self.path = path
+    self.name = name
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(path, check_same_thread=False, timeout=60)
+    # readers do not block the writer, so several jobs can share one cache file
+    self.connection.execute('PRAGMA journal_mode=WAL')
+    self.connection.execute(
+      'CREATE TABLE IF NOT EXISTS evaluations (key TEXT PRIMARY KEY, evaluation TEXT NOT NULL)')
+    self.connection.execute(
+      'CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+    self.connection.commit()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key: str) -> Optional[Dict]:
+    with self.lock:
+      row = self.connection.execute(
+        'SELECT evaluation FROM evaluations WHERE key = ?', (key,)).fetchone()
+      if row is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      return json.loads(row[0])
+
+  def put(self, key: str, evaluation: Dict) -> None:
+    with self.lock:
+      self.connection.execute(
+        'INSERT OR REPLACE INTO evaluations VALUES (?, ?)', (key, json.dumps(evaluation)))
+      self.connection.commit()
+
+  def __len__(self) -> int:
+    with self.lock:
+      return self.connection.execute('SELECT COUNT(*) FROM evaluations').fetchone()[0]
+
+  def total_stats(self) -> Dict[str, int]:
+    """Hits and misses of all the runs closed so far"""
+    with self.lock:
+      stats = dict(self.connection.execute('SELECT name, value FROM stats').fetchall())
+    return {'hits': stats.get('hits', 0), 'misses': stats.get('misses', 0)}
+
+  def summary(self) -> str:
+    total = self.total_stats()
+    lookups = total['hits'] + total['misses']
+    hit_rate = f'{100 * total["hits"] / lookups:.1f}%' if lookups else 'n/a'
+    return f'{self.path} ({len(self)} evaluations, hit rate of previous runs: {hit_rate} of {lookups})'
+
+  def run_summary(self) -> str:
+    """Hits and misses of this run"""
+    lookups = self.hits + self.misses
+    hit_rate = f'{100 * self.hits / lookups:.1f}%' if lookups else 'n/a'
+    return f'{self.name} of this run: {self.hits} hits, {self.misses} misses (hit rate: {hit_rate})'
+
+  def close(self) -> None:
+    with self.lock:
+      for name, value in (('hits', self.hits), ('misses', self.misses)):
+        self.connection.execute(
+          'INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?',
+          (name, value, value))
+      self.connection.commit()
+      self.connection.close()
+    print(self.run_summary())
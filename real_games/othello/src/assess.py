@@ -1,50 +1,105 @@
 """
-Assessment functions for Chess positions
+Assessment functions for Othello positions
+
+Every engine call is a task `task(engine, ...)` submitted to an executor:
+the EnginePool when one is given, otherwise the single `engine`.
+Tasks are submitted first and their results logged afterwards, in order,
+so independent evaluations run concurrently on a pool.
 """
 
-from typing import Dict
+import time
+from typing import Dict, Tuple
 from real_games.othello.src.edax import Engine
+from real_games.othello.src.bitboard import Board
+from real_games.engine_pool import EnginePool, SerialExecutor, completed
 from real_games.utils import Logger, parse_eval
 
-def assess_criticality(engine: Engine, logger: Logger, position: Dict, search_depth):
+def evaluate(engine: Engine, moves: str, depth: int = None, search: bool = True) -> Dict:
+  """
+  Evaluate the position after `moves`.
+  `depth` is the search level, or None to keep the level of the engine.
+  The evaluation also has the search level (`depth`, 0 for a static eval) and its duration (`seconds`), for records.
+  """
+  tic = time.perf_counter()
+  if depth is not None and depth != engine.depth:
+    engine.set_depth(depth)
+  engine.set_position(moves)
+  evaluation = engine.get_evaluation(search=search)
+  return dict(evaluation, depth=engine.depth if search else 0, seconds=time.perf_counter() - tic)
+
+def evaluate_static_and_search(engine: Engine, moves: str) -> Tuple[Dict, Dict]:
+  """
+  Static eval and search eval (at the level of the engine) of the position after `moves`,
+  as `evaluate(engine, moves, None, False)` and `evaluate(engine, moves)`, with one round trip to the engine.
+  """
+  tic = time.perf_counter()
+  engine.set_position(moves)
+  static_evaluation, search_evaluation = engine.get_static_and_search_evaluations()
+  # the round trip is shared by the two evaluations
+  seconds = (time.perf_counter() - tic) / 2
+  return dict(static_evaluation, depth=0, seconds=seconds), dict(search_evaluation, depth=engine.depth, seconds=seconds)
+
+def evaluate_children(engine: Engine, moves: str, depth: int) -> Dict[str, Dict]:
+  """
+  Evaluate the children of the position after `moves` with one `hint` for all of them
+  at level `depth`, i.e. every child is searched with `depth-1`.
+  """
+  tic = time.perf_counter()
+  if depth != engine.depth:
+    engine.set_depth(depth)
+  engine.set_position(moves)
+  evaluations = engine.get_children_evaluations()
+  # the search is shared by the children
+  seconds = (time.perf_counter() - tic) / max(len(evaluations), 1)
+  return {move: dict(evaluation, depth=depth-1, seconds=seconds) for move, evaluation in evaluations.items()}
+
+def assess_criticality(engine: Engine, logger: Logger, position: Dict, search_depth, pool: EnginePool = None, \
+  multi_hint: bool = False):
   """
     Analyzes the number of flipping children, finds the rate that minimax value is flipped.
-    The engine will evoke new game (`ucinewgame`) for each position.
 
-    `position` is a dictionary which 1 required key (`fen`) 
-    and 1 optional key (`moves`, mostly used for debugging)
+    If `multi_hint`, all children are evaluated by a single `hint` at the root
+    (children where the game is over are evaluated separately),
+    otherwise every child is searched on its own.
+
+    `position` is a dictionary with 1 required key (`moves`)
   """
-  
-  engine.set_position(position['moves'])
-  logger.print(position['moves'])
-  
-  engine.set_depth(search_depth)
-  score = engine.get_evaluation()
-  logger.print(parse_eval(score))
-
-  next_moves = engine.next_moves()
-  if len(next_moves) != 0:
-    engine.set_depth(search_depth-1) # decrease search depth for child nodes
-    for next_move in next_moves:
-      engine.set_position(position['moves'] + next_move)
-      child_score = engine.get_evaluation()
-      logger.print(parse_eval(child_score))
-
-def assess_noise(engine: Engine, logger, position: Dict, depth):
-  """
-  Assess the static eval and search eval for a position. 
+  executor = pool if pool is not None else SerialExecutor(engine)
+  moves = position['moves']
+  logger.print(moves)
+  logger.record_position(moves)
+
+  score = executor.submit(evaluate, moves, search_depth)
+  next_moves = Board.from_moves(moves).legal_moves() # no need for an engine round-trip
+  if multi_hint:
+    evaluations = executor.submit(evaluate_children, moves, search_depth).result()
+    child_scores = [completed(evaluations[next_move]) if next_move in evaluations \
+      else executor.submit(evaluate, moves + next_move, search_depth-1) \
+      for next_move in next_moves]
+  else:
+    # decrease search depth for child nodes
+    child_scores = [executor.submit(evaluate, moves + next_move, search_depth-1) \
+      for next_move in next_moves]
+
+  logger.print(parse_eval(score.result()))
+  logger.record_evaluation(score.result())
+  for i, (next_move, child_score) in enumerate(zip(next_moves, child_scores)):
+    logger.print(parse_eval(child_score.result()))
+    logger.record_evaluation(child_score.result(), child=i, move=next_move)
+
+def assess_noise(engine: Engine, logger, position: Dict, depth, pool: EnginePool = None):
+  """
+  Assess the static eval and search eval for a position.
   Log 2 lines to logger: position and result
 
-  The engine will evoke new game (`ucinewgame`) for each position.
-  
-  `position` is a dictionary which 1 required key (`fen`) 
-  and 1 optional key (`moves`, mostly used for debugging)
+  `position` is a dictionary with 1 required key (`moves`)
   """
-  engine.set_position(position['moves'])
-  
-  static_evaluation = engine.get_evaluation(search=False)
-  search_evaluation = engine.get_evaluation(search=True)
+  executor = pool if pool is not None else SerialExecutor(engine)
+  static_evaluation, search_evaluation = executor.submit(evaluate_static_and_search, position['moves']).result()
 
   logger.print(position['moves'])
   logger.print(f'{parse_eval(static_evaluation)} {parse_eval(search_evaluation)}')
-  return (static_evaluation, search_evaluation)
\ No newline at end of file
+  logger.record_position(position['moves'])
+  logger.record_evaluation(static_evaluation)
+  logger.record_evaluation(search_evaluation)
+  return (static_evaluation, search_evaluation)
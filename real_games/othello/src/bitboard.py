@@ -0,0 +1,161 @@
+"""
+Othello board on 64-bit masks, to generate moves without asking the engine.
+
+Square `A1` is bit 0, `H1` bit 7, `A2` bit 8, ..., `H8` bit 63 (same notation as Edax).
+Like Edax, a player without legal moves passes automatically,
+and move strings (e.g. `F5D6C3`) only contain actual moves.
+"""
+
+from typing import List, Tuple
+
+FULL = (1 << 64) - 1
+NOT_A = 0xfefefefefefefefe # every square but column A
+NOT_H = 0x7f7f7f7f7f7f7f7f # every square but column H
+
+# shift -> mask of the squares that can be reached without wrapping around the board
+DIRECTIONS = {
+  1: NOT_A, -1: NOT_H, # east, west
+  8: FULL, -8: FULL, # south, north (towards row 8, row 1)
+  9: NOT_A, 7: NOT_H, # south-east, south-west
+  -7: NOT_A, -9: NOT_H, # north-east, north-west
+}
+
+BLACK_START = (1 << 28) | (1 << 35) # E4, D5
+WHITE_START = (1 << 27) | (1 << 36) # D4, E5
+
+
+def _shift(mask: int, direction: int) -> int:
+  if direction > 0:
+    return (mask << direction) & DIRECTIONS[direction] & FULL
+  return (mask >> -direction) & DIRECTIONS[direction]
+
+
+def legal_moves_mask(player: int, opponent: int) -> int:
+  """Return the mask of the squares where `player` can move"""
+  empty = ~(player | opponent) & FULL
+  moves = 0
+  for direction in DIRECTIONS:
+    line = _shift(player, direction) & opponent
+    for _ in range(5): # at most 6 discs can be flipped in a row
+      line |= _shift(line, direction) & opponent
+    moves |= _shift(line, direction) & empty
+  return moves
+
+
+def flips_mask(player: int, opponent: int, square: int) -> int:
+  """Return the mask of the discs flipped when `player` moves on `square`"""
+  flipped = 0
+  for direction in DIRECTIONS:
+    line = 0
+    cursor = _shift(1 << square, direction)
+    while cursor & opponent:
+      line |= cursor
+      cursor = _shift(cursor, direction)
+    if cursor & player:
+      flipped |= line
+  return flipped
+
+
+def flip_vertical(mask: int) -> int:
+  """Mirror the board over the horizontal axis (row 1 <-> row 8)"""
+  return int.from_bytes(mask.to_bytes(8, 'little'), 'big')
+
+
+def mirror_horizontal(mask: int) -> int:
+  """Mirror the board over the vertical axis (column A <-> column H)"""
+  mask = ((mask >> 1) & 0x5555555555555555) | ((mask & 0x5555555555555555) << 1)
+  mask = ((mask >> 2) & 0x3333333333333333) | ((mask & 0x3333333333333333) << 2)
+  return ((mask >> 4) & 0x0f0f0f0f0f0f0f0f) | ((mask & 0x0f0f0f0f0f0f0f0f) << 4)
+
+
+def flip_diagonal(mask: int) -> int:
+  """Mirror the board over the A1-H8 diagonal"""
+  for shift, k in ((28, 0x0f0f0f0f00000000), (14, 0x3333000033330000), (7, 0x5500550055005500)):
+    t = k & (mask ^ (mask << shift))
+    mask ^= t ^ (t >> shift)
+  return mask
+
+
+def symmetries(mask: int) -> List[int]:
+  """The 8 images of `mask` by the symmetries of the board, in a fixed order"""
+  images = []
+  for diagonal in (mask, flip_diagonal(mask)):
+    for vertical in (diagonal, flip_vertical(diagonal)):
+      images += [vertical, mirror_horizontal(vertical)]
+  return images
+
+
+def canonical(player: int, opponent: int) -> Tuple[int, int]:
+  """Smallest image of the position (`player`, `opponent`) by the 8 symmetries of the board"""
+  return min(zip(symmetries(player), symmetries(opponent)))
+
+
+def square_to_notation(square: int) -> str:
+  return f'{chr(square % 8 + ord("A"))}{square // 8 + 1}'
+
+
+def notation_to_square(move: str) -> int:
+  return (int(move[1]) - 1) * 8 + ord(move[0].upper()) - ord('A')
+
+
+class Board:
+  """Othello position: discs of the player to move and of the opponent, plus the move history"""
+
+  def __init__(self):
+    self.player = BLACK_START
+    self.opponent = WHITE_START
+    self.black_to_move = True
+    self.moves = ''
+
+  @classmethod
+  def from_moves(cls, moves: str) -> 'Board':
+    """Return the board after `moves` (e.g. `F5D6`) from the initial position"""
+    board = cls()
+    for i in range(0, len(moves), 2):
+      board.play(moves[i:i+2])
+    return board
+
+  def copy(self) -> 'Board':
+    board = Board()
+    board.player, board.opponent = self.player, self.opponent
+    board.black_to_move, board.moves = self.black_to_move, self.moves
+    return board
+
+  @property
+  def black(self) -> int:
+    return self.player if self.black_to_move else self.opponent
+
+  @property
+  def white(self) -> int:
+    return self.opponent if self.black_to_move else self.player
+
+  def legal_moves(self) -> List[str]:
+    """Legal moves of the player to move, ordered A1, B1, ..., H8 (like Edax's board)"""
+    mask = legal_moves_mask(self.player, self.opponent)
+    moves = []
+    while mask:
+      lowest = mask & -mask
+      moves.append(square_to_notation(lowest.bit_length() - 1))
+      mask ^= lowest
+    return moves
+
+  def is_game_over(self) -> bool:
+    return legal_moves_mask(self.player, self.opponent) == 0
+
+  def play(self, move: str) -> None:
+    """Play `move` for the player to move, then pass if the other player cannot move"""
+    square = notation_to_square(move)
+    if not (legal_moves_mask(self.player, self.opponent) >> square) & 1:
+      raise ValueError(f'Illegal move {move} after {self.moves}')
+    flipped = flips_mask(self.player, self.opponent, square)
+    player = self.player | flipped | (1 << square)
+    opponent = self.opponent & ~flipped
+    self.moves += move.upper()
+
+    if legal_moves_mask(opponent, player) != 0 or legal_moves_mask(player, opponent) == 0:
+      # the opponent moves next (or nobody can move: game over)
+      self.player, self.opponent = opponent, player
+      self.black_to_move = not self.black_to_move
+    else:
+      # the opponent passes
+      self.player, self.opponent = player, opponent
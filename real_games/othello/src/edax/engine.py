@@ -1,11 +1,24 @@
 import os
 import subprocess
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 from random import choice
+from real_games.othello.src.bitboard import Board, canonical
+from real_games.eval_cache import EvalCache
+
+# first and last lines of the board drawn after every command
+BOARD_BORDER = '  A B C D E F G H'
 
 class Engine():
-  def __init__(self, depth=20):
-    """Import the engine executable"""
+  # when set, `get_evaluation` reads and writes scores there
+  eval_cache: Optional[EvalCache] = None
+
+  def __init__(self, depth=20, incremental=True, options: Dict = None):
+    """
+    Import the engine executable.
+    If `incremental`, `set_position` plays only the new moves when the new position
+    extends the current one, instead of replaying the game from the initial position.
+    `options` are Edax options, e.g. `{'n-tasks': 2, 'hash-table-size': 20}`.
+    """
     
     FILENAME = './lEdax-x64-custom'
     DIR = os.path.join('real_games', 'othello', 'src', 'edax')
@@ -18,6 +31,10 @@ class Engine():
     self._put('init')
     self._put(f'set level {depth}')
     self.depth = depth
+    self.incremental = incremental
+    self.info = '' # last line of the last search
+    for name, value in (options or {}).items():
+      self._put(f'set {name} {value}')
     self.position = self.current_position()
   
   """--------------------- PUBLIC FUNCTIONS ---------------------"""
@@ -27,10 +44,23 @@ class Engine():
     Set the board to the `position`. `position` is moves.
     `self.position` will also hold next moves, past board and future board.
     This should be the only method that change the board's state.
+
+    Every command redraws the board, so the new position is parsed from the output of `play`.
     """
-    self._put('init')
-    self._put(f'play {position}')
-    self.position = self.current_position()
+    position = position.upper()
+    current_moves = self.position['moves']
+    if self.incremental and position.startswith(current_moves):
+      if position == current_moves:
+        return
+      self.position = self._parse_position(self._put(f'play {position[len(current_moves):]}'))
+      if self.position['moves'] == position:
+        return
+      # e.g. the engine refused a move: fall back to a full reset
+
+    output = self._put('init')
+    if position != '':
+      output = self._put(f'play {position}')
+    self.position = self._parse_position(output)
 
   def set_depth(self, depth: int) -> None:
     """
@@ -39,25 +69,16 @@ class Engine():
     self.depth = depth
     self._put(f'set level {depth}')
 
+  def copy_state_from(self, other: 'Engine') -> None:
+    """Set the level and position of `other` (e.g. a crashed engine being replaced)"""
+    if other.depth != self.depth:
+      self.set_depth(other.depth)
+    self.set_position(other.position['moves'])
+
   def current_position(self) -> Dict:
     """Return current position"""
-    output = self._put('book show')
+    return self._parse_position(self._put('book show'))
 
-    past_board, future_board = [], []
-    for line in output[-9:-1]:
-      past_board.append(line.split('|')[-9:-1])
-      future_board.append(line.split(' ')[1:9])
-    
-    moves = self._past_board_to_moves(past_board)
-    next_moves = self._future_board_to_next_moves(future_board)
-    
-    return {
-      'past': past_board,
-      'future': future_board,
-      'moves': moves,
-      'next_moves': next_moves
-    }
-  
   def get_evaluation(self, search=True) -> Dict:
     """
     Return evaluation of the current position.
@@ -71,22 +92,11 @@ class Engine():
       count_white = sum(line.count('O') for line in self.position['future'])
       score = 64 if count_white > 0 else -64
     else:
-      if search:
-        # Search evaluation
-        output = self._put('hint')
-        verdict = output[3].split()[1]
-        score = (1 if verdict[0] == '+'else -1) * int(verdict[1:])
-      else:
-        # Static evaluation
-        output = self._put('eval')
-        # print(output)
-        score = int(output[1].strip().split()[2])
+      score = self._side_to_move_score(search)
 
       assert abs(score) <= 64
 
-      depth = len(self.position['moves']) // 2
-      if depth % 2 == 1:
-        score = -score
+      score = self._to_first_player(score, self.position['moves'])
       
 
     return {
@@ -94,12 +104,44 @@ class Engine():
       'value': score
     }
   
+  def get_static_and_search_evaluations(self) -> Tuple[Dict, Dict]:
+    """
+    Return the static and search evaluations of the current position,
+    the same as `get_evaluation(search=False)` and `get_evaluation()` with one round trip:
+    `eval` and `hint` are sent together, and only their scores are read from the output.
+    """
+    if len(self.position['next_moves']) == 0:
+      # Game over: no search
+      evaluation = self.get_evaluation()
+      return evaluation, evaluation
+    scores = {}
+    if self.eval_cache is not None:
+      for search in (False, True):
+        evaluation = self.eval_cache.get(self._eval_key(search))
+        if evaluation is not None:
+          scores[search] = evaluation['value']
+    missing = [search for search in (False, True) if search not in scores]
+    if missing:
+      engine_scores = self._engine_scores(missing)
+      if self.eval_cache is not None:
+        for search, score in engine_scores.items():
+          self.eval_cache.put(self._eval_key(search), {'type': 'score', 'value': score})
+      scores.update(engine_scores)
+    static, search = (self._to_first_player(scores[search], self.position['moves']) for search in (False, True))
+    return {'type': 'score', 'value': static}, {'type': 'score', 'value': search}
+
   def random_position(self, depth: int, n_top_moves: int = 0, \
     generation_search_depth: int = 10, has_children: bool = False) -> Dict:
     """
     Return a random position.
     Format: {type: position_string}
+
+    Purely random games (`n_top_moves == 0`) are played on a bitboard,
+    and only the final position is set on the engine.
     """
+    if n_top_moves == 0:
+      return self._random_position_bitboard(depth, has_children)
+
     old_depth = self.depth
     self.set_depth(generation_search_depth)
 
@@ -128,26 +170,183 @@ class Engine():
 
     return self.position
 
+  def _random_position_bitboard(self, depth: int, has_children: bool) -> Dict:
+    while True:
+      board = Board()
+      success = True
+      for _ in range(depth + has_children):
+        next_moves = board.legal_moves()
+        if len(next_moves) == 0:
+          success = False
+          break
+        board.play(choice(next_moves))
+
+      if success:
+        break
+
+    moves = board.moves[:-2] if has_children else board.moves
+    self.set_position(moves)
+    assert len(self.position['moves']) == 2 * depth
+    return self.position
+
+  def get_children_evaluations(self) -> Dict[str, Dict]:
+    """
+    Evaluate all children of the current position with a single `hint <n_children>`
+    at the current level: the line of each move is its child searched 1 ply less deep.
+
+    Scores get the perspective of `get_evaluation` on each child, from the child's player to move
+    (the opponent, or the same player when the opponent has to pass).
+    Children where the game is over are left out, `get_evaluation` scores them without a search.
+    Return: move -> evaluation
+    """
+    next_moves = self.position['next_moves']
+    if len(next_moves) == 0:
+      return {}
+    board = Board.from_moves(self.position['moves'])
+    evaluations = {}
+    for move, score in self._parse_hints(self._put(f'hint {len(next_moves)}'), len(next_moves)):
+      child = board.copy()
+      child.play(move)
+      if child.is_game_over():
+        continue
+      if child.black_to_move != board.black_to_move:
+        score = -score
+      evaluations[move] = {
+        'type': 'score',
+        'value': self._to_first_player(score, child.moves)
+      }
+    return evaluations
+
   def next_moves(self) -> List[str]:
     return self.position['next_moves']
 
   def top_next_moves(self, num_top_moves: int) -> List[str]:
     num_top_moves = min(num_top_moves, len(self.position['next_moves']))
     output = self._put(f'hint {num_top_moves}')
-    # for line in output:
-    #   print(line)
-    FIRST_HINT = 3
-    next_moves = []
-    for row in range(FIRST_HINT, FIRST_HINT + num_top_moves):
-      PV_POSITION = 52
-      # print(output[row][PV_POSITION:])
-      next_move = output[row][PV_POSITION:].split()[0]
-      next_move = next_move[0].upper() + next_move[1] # capitalize the move
-      next_moves.append(next_move)
+    next_moves = [next_move for next_move, _ in self._parse_hints(output, num_top_moves)]
     # print(f'Top moves: {next_moves}')
     return next_moves      
 
+  def __del__(self) -> None:
+    # `quit` does not redraw the board, so `_put` would wait forever
+    if getattr(self, 'engine', None) is not None:
+      self.engine.kill()
+
   """--------------------- PRIVATE FUNCTIONS ---------------------"""
+  def _to_first_player(self, score: int, moves: str) -> int:
+    """Turn the score for the player to move after `moves` into the perspective of get_evaluation"""
+    depth = len(moves) // 2
+    if depth % 2 == 1:
+      score = -score
+    return score
+
+  def _parse_hints(self, output: List[str], n_hints: int) -> List[Tuple[str, int]]:
+    """Return the first move and score (for the player to move) of the lines of `hint n_hints`"""
+    FIRST_HINT = 3
+    PV_POSITION = 52
+    hints = []
+    for row in range(FIRST_HINT, FIRST_HINT + n_hints):
+      verdict = output[row].split()[1]
+      next_move = output[row][PV_POSITION:].split()[0]
+      next_move = next_move[0].upper() + next_move[1] # capitalize the move
+      hints.append((next_move, (1 if verdict[0] == '+' else -1) * int(verdict[1:])))
+    return hints
+
+  def _engine_score(self, search: bool) -> int:
+    """Score of the current position for the player to move, computed by the engine"""
+    if search:
+      # Search evaluation
+      output = self._put('hint')
+      self.info = output[3].strip()
+      verdict = output[3].split()[1]
+      return (1 if verdict[0] == '+'else -1) * int(verdict[1:])
+    # Static evaluation
+    output = self._put('eval')
+    return int(output[1].strip().split()[2])
+
+  def _engine_scores(self, searches: List[bool]) -> Dict[bool, int]:
+    """
+    Scores of the current position for the player to move, of `eval` or `hint` for each of `searches`,
+    sent at once. Each output is read up to its board, without parsing it (the position does not change).
+    The game must not be over.
+    """
+    if not self.engine.stdin:
+      raise BrokenPipeError()
+    self.engine.stdin.write(''.join('hint\n' if search else 'eval\n' for search in searches))
+    self.engine.stdin.flush()
+    scores = {}
+    for search in searches:
+      count_border = 0
+      while count_border < 2:
+        line = self._read_line()
+        if line.startswith(BOARD_BORDER):
+          count_border += 1
+        elif search in scores:
+          continue
+        elif not search and line.startswith('Static eval:'):
+          scores[search] = int(line.split()[2])
+        elif search:
+          # first line of the hint table, e.g. `    3   +00   0:00.000   127   G5`
+          tokens = line.split()
+          if len(tokens) > 1 and tokens[1][:1] in '+-' and tokens[1][1:].isdigit():
+            self.info = line.strip()
+            scores[search] = (1 if tokens[1][0] == '+' else -1) * int(tokens[1][1:])
+      # the line after the board
+      self._read_line()
+    return scores
+
+  def _eval_key(self, search: bool) -> str:
+    """
+    Cache key of the current position: the board seen by the player to move,
+    in canonical form (so the 8 symmetric boards share it), and the evaluation.
+    """
+    black, white = 0, 0
+    for row, line in enumerate(self.position['future']):
+      for col, cell in enumerate(line):
+        if cell == '*':
+          black |= 1 << (row * 8 + col)
+        elif cell == 'O':
+          white |= 1 << (row * 8 + col)
+    player, opponent = (black, white) if self.position['black_to_move'] else (white, black)
+    player, opponent = canonical(player, opponent)
+    evaluation = f'level {self.depth}' if search else 'static'
+    return f'edax {player:016x} {opponent:016x}|{evaluation}'
+
+  def _side_to_move_score(self, search: bool) -> int:
+    """
+    Score of the current position for the player to move, through `eval_cache` when it is set.
+    The score does not change with the symmetries of the board, nor with the colors,
+    so it can be cached for the canonical board.
+    """
+    if self.eval_cache is None:
+      return self._engine_score(search)
+    key = self._eval_key(search)
+    evaluation = self.eval_cache.get(key)
+    if evaluation is None:
+      evaluation = {'type': 'score', 'value': self._engine_score(search)}
+      self.eval_cache.put(key, evaluation)
+    return evaluation['value']
+
+  def _parse_position(self, output: List[str]) -> Dict:
+    """Return the position drawn at the end of a command's output"""
+    past_board, future_board = [], []
+    for line in output[-9:-1]:
+      past_board.append(line.split('|')[-9:-1])
+      future_board.append(line.split(' ')[1:9])
+    
+    moves = self._past_board_to_moves(past_board)
+    next_moves = self._future_board_to_next_moves(future_board)
+    # e.g. "Black's turn (*)", missing when the game is over
+    turns = [line for line in output[-9:-1] if "'s turn" in line]
+    
+    return {
+      'past': past_board,
+      'future': future_board,
+      'moves': moves,
+      'next_moves': next_moves,
+      'black_to_move': "Black's turn" in turns[0] if turns else None
+    }
+
   def _put(self, command: str) -> None:
     """
     Send `command` to the engine's GUI
@@ -164,11 +363,14 @@ class Engine():
   def _read_line(self) -> str:
     if not self.engine.stdout:
       raise BrokenPipeError()
-    return self.engine.stdout.readline()
+    line = self.engine.stdout.readline()
+    if line == '':
+      # end of file: every line read from a live engine ends with a newline
+      raise BrokenPipeError('The engine process has exited')
+    return line
   
   def _output(self):
     output = []
-    BOARD_BORDER = '  A B C D E F G H'
     count_border = 0
     while True:
       line = self._read_line()
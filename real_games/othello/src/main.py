@@ -8,27 +8,49 @@
 
 import subprocess
 import click
+from functools import partial
 from os.path import join
 from real_games.othello.src.assess import assess_criticality, assess_noise
 from real_games.utils import Logger
+from real_games.engine_pool import EnginePool, Supervisor, assess_concurrently
+from real_games.pipeline import run_pipeline
+from real_games.benchmark import load_engine_config
+from real_games.eval_cache import EvalCache
+from real_games.engine_server import EngineClient, check_leases
+from real_games.corpus import corpus_positions
 from real_games.othello.src.edax import Engine
 import time
 
 def init_logger(batch_id, job_id, objective, n_positions, position_depth, \
-  search_depth, n_top_moves):
+  search_depth, n_top_moves, eval_cache: EvalCache = None, child_eval: str = 'search', \
+  engine_options: dict = None, records: bool = False, resume: bool = False, engine_server: str = None, \
+  corpus: str = None):
   
   base_path = join('logs', batch_id) 
   subprocess.run(['mkdir', '-p', base_path])
   filepath = join(base_path, job_id + '.txt')
-  logger = Logger(filepath)
+  options_info = f"Eval cache: {eval_cache.summary()}\n" if eval_cache is not None else ""
+  if child_eval != 'search':
+    options_info += f"Child evaluation: {child_eval}\n"
+  if engine_options:
+    options_info += f"Engine options: {engine_options}\n"
+  if engine_server is not None:
+    options_info += f"Engine server: {engine_server}\n"
+  if corpus is not None:
+    options_info += f"Corpus: {corpus}\n"
   title = f"""Othello
 Objective: {objective}
 Num positions: {n_positions}
 Position depth: {position_depth}
 Search depth: {search_depth}
 Num top moves: {n_top_moves}
-  """
-  logger.print(title)
+{options_info}  """
+  try:
+    logger = Logger(filepath, join(base_path, job_id + '.rec') if records else None, resume, header=title)
+  except ValueError as error:
+    raise click.UsageError(str(error))
+  if logger.resumed:
+    print(f'Resuming {filepath} after {logger.n_completed} positions')
   return logger
 
 OBJECTIVES = ['flip-grand', 'criticality', 'noise']
@@ -49,28 +71,122 @@ OBJECTIVES = ['flip-grand', 'criticality', 'noise']
   help='Depth of generated positions')
 @click.option('--generation-search-depth', type=int, default=10, \
   help='Depth of top-move search for position generation')
-def run_exp(objective, batch_id, job_id, search_depth, n_positions, n_top_moves, position_depth, generation_search_depth):
+@click.option('--n-engines', type=int, default=None, \
+  help='No. engine processes evaluating positions concurrently (default: from --engine-config, or 1)')
+@click.option('--engine-config', type=click.Path(exists=True, dir_okay=False), default=None, \
+  help='JSON file written by `python -m real_games.benchmark othello`: engine options and no. engines')
+@click.option('--n-generators', type=int, default=0, \
+  help='No. engine processes generating positions in a pipeline, \
+    while --n-engines processes assess them (0: no pipeline)')
+@click.option('--corpus', type=click.Path(exists=True, dir_okay=False), default=None, \
+  help='Position corpus (see real_games/corpus.py): assess its positions of the generation parameters \
+    instead of generating new ones')
+@click.option('--engine-server', type=click.Path(exists=True, dir_okay=False), default=None, \
+  help='Unix socket of `python -m real_games.engine_server othello`, whose warm engines replace local ones')
+@click.option('--engine-timeout', type=float, default=None, \
+  help='Seconds an engine may take to answer before it is killed and restarted (default: no limit)')
+@click.option('--engine-retries', type=int, default=2, \
+  help='No. times an engine is restarted in a row after dying or timing out, before the run fails')
+@click.option('--resume', is_flag=True, default=False, \
+  help='Continue the log of an interrupted run with the same job id, after its last complete position')
+@click.option('--records', is_flag=True, default=False, \
+  help='Also write binary records of the evaluations (<job-id>.rec, see real_games/records.py)')
+@click.option('--eval-cache', type=click.Path(dir_okay=False), default=None, \
+  help='SQLite file caching evaluations across runs, shared by symmetric boards (disabled by default)')
+@click.option('--child-eval', type=click.Choice(['search', 'multi-hint']), default='search', \
+  help='Criticality: search every child on its own, or evaluate all children with one hint at the root')
+def run_exp(objective, batch_id, job_id, search_depth, n_positions, n_top_moves, position_depth, generation_search_depth, n_engines, engine_config, n_generators, corpus, engine_server, engine_timeout, engine_retries, resume, records, eval_cache, child_eval):
   tic = time.time()
-  logger = init_logger(batch_id, job_id, objective, n_positions, position_depth, search_depth, n_top_moves)
-  engine = Engine()
+  engine_options = {}
+  if engine_config is not None:
+    engine_config = load_engine_config(engine_config, 'othello')
+    engine_options = engine_config['options']
+    if n_engines is None:
+      n_engines = engine_config['n_engines']
+  if n_engines is None:
+    n_engines = 1
+  if engine_server is not None and (engine_options or eval_cache is not None):
+    raise click.BadParameter('Engines of --engine-server have the options and eval cache of the server')
+  if corpus is not None:
+    if n_generators > 0:
+      raise click.BadParameter('Positions of --corpus are not generated, use it without --n-generators')
+    positions = corpus_positions(corpus, 'othello', dict(position_depth=position_depth, n_top_moves=n_top_moves, \
+      generation_search_depth=generation_search_depth), n_positions)
+  if engine_server is not None:
+    # leases held at the same time: pipeline workers, or the pool and its generator, or one runner
+    if n_generators > 0:
+      n_leases = n_generators + n_engines
+    elif n_engines > 1:
+      n_leases = n_engines + (corpus is None)
+    else:
+      n_leases = 1
+    check_leases(engine_server, n_leases)
+  if eval_cache is not None:
+    eval_cache = EvalCache(eval_cache)
+  logger = init_logger(batch_id, job_id, objective, n_positions, position_depth, search_depth, n_top_moves, eval_cache, child_eval, engine_options, records=records, resume=resume, engine_server=engine_server, corpus=corpus)
+  n_positions -= logger.n_completed
+  if corpus is not None:
+    # positions come from the corpus, no engine generates them
+    next_position = iter(positions[logger.n_completed:]).__next__
+
+  def create_engine():
+    engine = Engine(options=engine_options)
+    engine.eval_cache = eval_cache
+    return engine
 
   has_children = True
   if objective == 'criticality':
     assess = assess_criticality
+    if child_eval == 'multi-hint':
+      assess = partial(assess_criticality, multi_hint=True)
     has_children = True
   elif objective == 'noise':
     assess = assess_noise
 
-  for i in range(n_positions):
-    position = engine.random_position(position_depth, \
-      n_top_moves, generation_search_depth=generation_search_depth, \
-        has_children=has_children)
-    print(f'Position {i+1}/{n_positions}: {position["moves"]}')
-    
-    assess(engine, logger, position, search_depth)
-    logger.print("END")
+  # a partial of a method (rather than a closure) can be sent to an engine server
+  generate = partial(Engine.random_position, depth=position_depth, \
+    n_top_moves=n_top_moves, generation_search_depth=generation_search_depth, \
+      has_children=has_children)
+
+  def create_runner():
+    """Runs the tasks on an engine: a supervised local one, or a lease on the engine server"""
+    if engine_server is not None:
+      return EngineClient(engine_server)
+    return Supervisor(create_engine, engine_timeout, engine_retries)
+
+  if n_generators > 0:
+    # generators and assessors each have their own engines
+    run_pipeline(create_engine, generate, assess, logger, n_positions, search_depth, n_generators, n_engines, \
+      create_runner=create_runner)
+  elif n_engines > 1:
+    # evaluations run on a pool of engines, another engine only generates positions
+    if corpus is None:
+      generator = create_runner()
+      next_position = partial(generator.run, generate)
+    pool = EnginePool(create_engine, n_engines, create_runner=create_runner)
+    assess_concurrently(next_position, assess, logger, pool, n_positions, search_depth)
+    pool.close()
+    if corpus is None:
+      generator.close()
+  else:
+    # a supervisor restarts the engine when it dies or hangs, and runs its task again
+    runner = create_runner()
+    if corpus is None:
+      next_position = partial(runner.run, generate)
+    for i in range(n_positions):
+      position = next_position()
+      print(f'Position {i+1}/{n_positions}: {position["moves"]}')
+      
+      assess(None, logger, position, search_depth, runner)
+      logger.end_position()
+    runner.close()
   
+  # statistics of the run, after the last position (cut when the log is resumed)
+  if eval_cache is not None:
+    logger.print(eval_cache.run_summary())
   logger.close()
+  if eval_cache is not None:
+    eval_cache.close()
 
   toc = time.time()
   print(f'{toc - tic} seconds')
@@ -0,0 +1,67 @@
+"""
+Benchmark the per-position protocol overhead of the Othello noise objective
+
+  python -m real_games.othello.src.protocol_benchmark --n-positions 200 --level 1
+
+Every position is evaluated as the noise objective did before (`eval` then `hint`, two round trips,
+each reading and parsing the board redrawn by Edax) and as it does now (`eval` and `hint` sent together,
+only their scores read). At a low level the search is short, so the time per position is mostly protocol.
+Both ways must give the same evaluations. Positions come from random games (seeded).
+"""
+
+import random
+import time
+from typing import Callable, Dict, List
+import click
+from real_games.othello.src.edax import Engine
+
+
+def _separate(engine: Engine) -> tuple:
+  return engine.get_evaluation(search=False), engine.get_evaluation()
+
+
+def _time(engine: Engine, evaluate: Callable, positions: List[Dict]) -> tuple:
+  """Seconds spent in `evaluate` on `positions` (setting the positions is not timed), and the scores"""
+  seconds, scores = 0, []
+  for position in positions:
+    engine.set_position(position['moves'])
+    tic = time.perf_counter()
+    evaluations = evaluate(engine)
+    seconds += time.perf_counter() - tic
+    scores.append(tuple(evaluation['value'] for evaluation in evaluations))
+  return seconds, scores
+
+
+@click.command()
+@click.option('--n-positions', type=int, default=200, help='No. positions to evaluate')
+@click.option('--position-depth', type=int, default=20, help='Depth of the random positions')
+@click.option('--level', type=int, default=1, help='Search level of `hint` (low: the protocol dominates)')
+@click.option('--rounds', type=int, default=3, help='No. times the positions are evaluated each way (best is kept)')
+@click.option('--seed', type=int, default=0, help='Seed of the random positions')
+def main(n_positions, position_depth, level, rounds, seed):
+  random.seed(seed)
+  engine = Engine()
+  positions = [dict(engine.random_position(position_depth, 0)) for _ in range(n_positions)]
+  engine.set_depth(level)
+
+  ways = {'eval + hint (2 round trips)': _separate, 'eval and hint together': Engine.get_static_and_search_evaluations}
+  best = {name: float('inf') for name in ways}
+  expected = None
+  for i in range(rounds):
+    # alternate the order, so that neither way always runs on a warmer engine
+    for name in (list(ways) if i % 2 == 0 else list(reversed(ways))):
+      seconds, scores = _time(engine, ways[name], positions)
+      if expected is None:
+        expected = scores
+      elif scores != expected:
+        raise click.ClickException(f'{name} gives other evaluations')
+      best[name] = min(best[name], seconds)
+
+  for name, seconds in best.items():
+    print(f'{name}: {seconds / n_positions * 1000:.3f} ms per position')
+  before, after = best.values()
+  print(f'Saved {(before - after) / n_positions * 1000:.3f} ms per position ({(1 - after / before) * 100:.0f}%)')
+
+
+if __name__ == '__main__':
+  main()
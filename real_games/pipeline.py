@@ -0,0 +1,123 @@
+"""
+Generate and assess positions at the same time, on separate engines
+
+Generator workers each own an engine and put positions into a bounded queue,
+assessor workers each own an engine and take positions from it.
+When the queue is full, generators wait for the assessors (backpressure).
+Assessments write into their own buffers, which are written into the logger
+in the order of the positions, so the log has the same layout as a serial run.
+Positions too far ahead of the next one to log are not generated (nor assessed) yet,
+so that a slow position does not let buffers pile up behind it.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+from real_games.engine_pool import Supervisor
+from real_games.utils import BufferLogger, Logger
+
+# put into the queue by the last generator, once per assessor
+_DONE = None
+# seconds between checks for failed workers while waiting on the queue
+_POLL = 0.1
+
+
+def run_pipeline(create_engine: Callable, generate: Callable, assess: Callable, logger: Logger, \
+  n_positions: int, search_depth: int, n_generators: int, n_assessors: int, queue_size: int = None, \
+  timeout: float = None, retries: int = 0, create_runner: Callable = None) -> None:
+  """
+  Assess `n_positions` positions, generated by `generate(engine)` on `n_generators` engines
+  and assessed by `assess(None, logger, position, search_depth, executor)` on `n_assessors` engines.
+  At most `queue_size` (default: 2 per assessor) positions wait between generators and assessors,
+  and positions are only generated and assessed less than `queue_size` ahead of the next one to log.
+  Every engine is supervised (see `Supervisor`) with `timeout` and `retries`,
+  or replaced by a result of `create_runner` when it is given (see `EnginePool`).
+  """
+  create_runner = create_runner or (lambda: Supervisor(create_engine, timeout, retries))
+  queue_size = queue_size or 2 * n_assessors
+  positions = queue.Queue(maxsize=queue_size)
+  buffers: Dict[int, BufferLogger] = {}
+  lock = threading.Condition()
+  next_index = [0] # next position to generate
+  next_to_log = [0] # next position to write into the logger
+  running_generators = [n_generators]
+  errors = []
+
+  # queue operations give up when a worker has failed, so that no worker waits forever
+  def put(item) -> None:
+    while not errors:
+      try:
+        return positions.put(item, timeout=_POLL)
+      except queue.Full:
+        pass
+
+  def get():
+    while not errors:
+      try:
+        return positions.get(timeout=_POLL)
+      except queue.Empty:
+        pass
+    return _DONE
+
+  def generator():
+    runner = create_runner()
+    try:
+      while not errors:
+        with lock:
+          # the position to log next was taken already, so this wait ends
+          lock.wait_for(lambda: next_index[0] < next_to_log[0] + queue_size \
+            or next_index[0] >= n_positions or errors)
+          if errors:
+            break
+          i = next_index[0]
+          next_index[0] += 1
+        if i >= n_positions:
+          break
+        put((i, runner.run(generate)))
+    finally:
+      runner.close()
+      with lock:
+        running_generators[0] -= 1
+        last = running_generators[0] == 0
+      if last:
+        for _ in range(n_assessors):
+          put(_DONE)
+
+  def assessor():
+    runner = create_runner()
+    try:
+      while True:
+        item = get()
+        if item is _DONE:
+          break
+        i, position = item
+        buffer = BufferLogger()
+        assess(None, buffer, position, search_depth, runner)
+        with lock:
+          buffers[i] = buffer
+          lock.notify_all()
+    finally:
+      runner.close()
+
+  def watch(future):
+    if future.exception() is not None:
+      with lock:
+        errors.append(future.exception())
+        lock.notify_all()
+
+  with ThreadPoolExecutor(max_workers=n_generators + n_assessors) as workers:
+    for worker in [generator] * n_generators + [assessor] * n_assessors:
+      workers.submit(worker).add_done_callback(watch)
+
+    for i in range(n_positions):
+      with lock:
+        lock.wait_for(lambda: i in buffers or errors)
+        if errors:
+          raise errors[0]
+        buffer = buffers.pop(i)
+        next_to_log[0] = i + 1
+        lock.notify_all()
+      print(f'Position {i+1}/{n_positions}')
+      buffer.flush_to(logger)
+      logger.end_position()
@@ -0,0 +1,271 @@
+"""
+Binary records of real-game experiments, next to (or converted from) the text logs
+
+A record file starts with `MAGIC` and the header (text of the log header, as a `<I` length and UTF-8 bytes),
+followed by the evaluations: contiguous, fixed-size `EVAL_DTYPE` items, which are read (or memory-mapped)
+in one call, without parsing. Positions (FEN or Othello moves) are kept in an index next to it,
+`<file>.positions`, one per line: the `position` field of an evaluation is its line number.
+
+  header, positions, evaluations = read_records('logs/chess/criticality.rec')
+  roots = evaluations[evaluations['child'] == -1]
+
+Text logs can be converted:
+
+  python -m real_games.records convert logs/chess/criticality.txt logs/chess/criticality.rec
+  python -m real_games.records summary logs/chess/criticality.rec
+"""
+
+import os
+import struct
+from typing import Dict, List, Tuple
+import click
+import numpy as np
+
+MAGIC = b'RGREC2\n'
+
+EVAL_DTYPE = np.dtype([
+  ('position', '<u4'), # index of the position in the file
+  ('child', '<i2'), # index of the child in the logged order, -1 for the position itself
+  ('grandchild', '<i2'), # index of the grandchild of `child`, -1 for the position or child
+  ('move', 'S11'), # moves from the position, space separated ('' when not logged)
+  ('depth', '<i2'), # search depth (-1: unknown)
+  ('nodes', '<u4'), # node budget of the search, 0 when limited by depth
+  ('score_type', 'u1'), # index in SCORE_TYPES
+  ('value', '<i4'),
+  ('seconds', '<f4'), # NaN: not measured
+])
+
+SCORE_TYPES = ['cp', 'mate', 'score']
+
+_LENGTH = struct.Struct('<I')
+
+
+def positions_path(path: str) -> str:
+  """Path of the positions of the record file `path`"""
+  return f'{path}.positions'
+
+
+class RecordWriter:
+  """
+  Buffered writer of a record file (and its positions). The header comes before any evaluation.
+  With `keep_positions`, the existing file is resumed: positions after its first `keep_positions`
+  and their evaluations (e.g. of a position interrupted by a crash) are removed, and new ones are appended.
+  """
+  def __init__(self, path: str, keep_positions: int = None):
+    self.item = np.zeros(1, dtype=EVAL_DTYPE)
+    if keep_positions is None:
+      self.file = open(path, 'wb', buffering=1 << 20)
+      self.file.write(MAGIC)
+      self.positions = open(positions_path(path), 'wb', buffering=1 << 16)
+      self.has_header = False
+      self.n_positions = 0
+      return
+    evaluations_size, positions_size, self.has_header = _resume_sizes(path, keep_positions)
+    with open(path, 'r+b') as file:
+      file.truncate(evaluations_size)
+    with open(positions_path(path), 'r+b') as file:
+      file.truncate(positions_size)
+    self.file = open(path, 'ab', buffering=1 << 20)
+    self.positions = open(positions_path(path), 'ab', buffering=1 << 16)
+    self.n_positions = keep_positions
+
+  def header(self, text: str) -> None:
+    if self.has_header:
+      raise ValueError('The header of a record file is written once, before its evaluations')
+    data = text.rstrip().encode()
+    self.file.write(_LENGTH.pack(len(data)) + data)
+    self.has_header = True
+
+  def position(self, position: str) -> None:
+    self.positions.write(position.encode() + b'\n')
+    self.n_positions += 1
+
+  def evaluation(self, evaluation: Dict, child: int = -1, grandchild: int = -1, move: str = '') -> None:
+    """
+    Record `evaluation` (`{type, value}`, optionally `depth`, `nodes` and `seconds`)
+    of the last position, or of one of its children / grandchildren
+    """
+    if not self.has_header:
+      self.header('')
+    item = self.item[0]
+    item['position'] = self.n_positions - 1
+    item['child'] = child
+    item['grandchild'] = grandchild
+    item['move'] = move.encode()
+    depth = evaluation.get('depth')
+    item['depth'] = -1 if depth is None else depth
+    item['nodes'] = evaluation.get('nodes') or 0
+    item['score_type'] = SCORE_TYPES.index(evaluation['type'])
+    item['value'] = evaluation['value']
+    seconds = evaluation.get('seconds')
+    item['seconds'] = np.nan if seconds is None else seconds
+    self.file.write(self.item.tobytes())
+
+  def flush(self) -> None:
+    self.positions.flush()
+    self.file.flush()
+
+  def close(self) -> None:
+    if not self.has_header:
+      self.header('')
+    self.positions.close()
+    self.file.close()
+
+
+def _read_header(path: str) -> Tuple[str, int]:
+  """Return the header of a record file (None if it was not written) and the offset of its evaluations"""
+  with open(path, 'rb') as file:
+    magic = file.read(len(MAGIC))
+    if magic != MAGIC:
+      older = magic[:-2] == MAGIC[:-2]
+      raise ValueError(f'{path} is not a record file' + \
+        (' of this version: convert its text log again' if older else ''))
+    length = file.read(_LENGTH.size)
+    if len(length) < _LENGTH.size:
+      return None, len(MAGIC)
+    length, = _LENGTH.unpack(length)
+    return file.read(length).decode(), len(MAGIC) + _LENGTH.size + length
+
+
+def _read_evaluations(path: str, offset: int, mmap: bool = False) -> np.ndarray:
+  # an item cut by a crash is left out
+  count = (os.path.getsize(path) - offset) // EVAL_DTYPE.itemsize
+  if mmap and count > 0:
+    return np.memmap(path, dtype=EVAL_DTYPE, mode='r', offset=offset, shape=(count,))
+  return np.fromfile(path, dtype=EVAL_DTYPE, count=count, offset=offset)
+
+
+def _read_positions(path: str) -> List[bytes]:
+  """Positions of the record file `path` (a line cut by a crash is left out)"""
+  with open(positions_path(path), 'rb') as file:
+    return file.read().split(b'\n')[:-1]
+
+
+def _resume_sizes(path: str, n_positions: int) -> Tuple[int, int, bool]:
+  """
+  Sizes of the record file `path` and of its positions with only their first `n_positions` positions,
+  and whether it has its header
+  """
+  header, offset = _read_header(path)
+  evaluations = _read_evaluations(path, offset, mmap=True)
+  # evaluations are in the order of their positions
+  n_evaluations = int(np.searchsorted(evaluations['position'], n_positions))
+  positions = _read_positions(path)
+  if len(positions) < n_positions:
+    raise ValueError(f'{path} has {len(positions)} positions, fewer than the {n_positions} to keep')
+  positions_size = sum(len(position) + 1 for position in positions[:n_positions])
+  return offset + n_evaluations * EVAL_DTYPE.itemsize, positions_size, header is not None
+
+
+def read_records(path: str, mmap: bool = False) -> Tuple[str, List[str], np.ndarray]:
+  """
+  Return the header, the positions and the evaluations (array of EVAL_DTYPE) of a record file.
+  With `mmap`, evaluations are memory-mapped instead of read.
+  """
+  header, offset = _read_header(path)
+  positions = [position.decode() for position in _read_positions(path)]
+  return header or '', positions, _read_evaluations(path, offset, mmap)
+
+
+def _parse_eval(text: str) -> Dict:
+  """Inverse of `real_games.utils.parse_eval`"""
+  e_type, value = text.split()
+  return {'type': e_type, 'value': int(value)}
+
+
+def convert_text_log(text_path: str, records_path: str) -> None:
+  """
+  Convert a text log (criticality, noise, flipping correlation or depth curve, chess or Othello) into records.
+  Text logs do not have timings, nor the moves of criticality children (only their order).
+  """
+  with open(text_path) as file:
+    lines = [line.rstrip('\n') for line in file]
+  end_of_header = next(i for i, line in enumerate(lines) if line.strip() == '')
+  header = lines[:end_of_header]
+  fields = dict(line.strip().split(': ', 1) for line in header if ': ' in line)
+  if fields['Objective'] == 'hash-comparison':
+    raise ValueError(f'{text_path}: hash-comparison logs are not converted, run them with --records')
+  othello = header[0].strip() == 'Othello'
+  search_depth = int(fields['Search depth'])
+  search_nodes = int(fields.get('Search nodes', 0))
+
+  def search(plies: int) -> Dict:
+    """Budget of the search of the position (`plies` = 0), of a child (1) or of a grandchild (2)"""
+    if search_nodes:
+      return {'depth': -1, 'nodes': search_nodes}
+    return {'depth': search_depth - plies}
+
+  writer = RecordWriter(records_path)
+  writer.header('\n'.join(header))
+  block = []
+  for line in lines[end_of_header+1:]:
+    if line.strip() == '':
+      continue
+    if line != 'END':
+      block.append(line)
+      continue
+
+    writer.position(block[0])
+    if fields['Objective'] == 'noise':
+      tokens = block[1].split()
+      # static evals have depth 0, except searches of depth 1 (chess without --static-eval;
+      # with it, positions in check are not told apart)
+      static_depth = 0 if othello or 'Static eval' in fields else 1
+      writer.evaluation({**_parse_eval(' '.join(tokens[:2])), 'depth': static_depth})
+      # Othello searches at the level of the engine, which is not logged
+      writer.evaluation({**_parse_eval(' '.join(tokens[2:])), **({'depth': -1} if othello else search(0))})
+    elif fields['Objective'] == 'depth-curve':
+      for line in block[1:]:
+        depth, evaluation = line.split(' ', 1)
+        writer.evaluation({**_parse_eval(evaluation), 'depth': int(depth)})
+    elif 'Children' in block:
+      # flipping correlation
+      writer.evaluation({**_parse_eval(block[1]), **search(0)})
+      grand_children = block.index('Grand children')
+      for i, child in enumerate(block[block.index('Children')+1:grand_children]):
+        move, child_eval = child.split(' ', 1)
+        writer.evaluation({**_parse_eval(child_eval), **search(1)}, child=i, move=move)
+      child, grandchild, move = -1, 0, ''
+      for grand_child_line in block[grand_children+1:]:
+        if grand_child_line.startswith('First move = '):
+          child, grandchild, move = child + 1, 0, grand_child_line[len('First move = '):]
+          continue
+        writer.evaluation({**_parse_eval(grand_child_line), **search(2)}, \
+          child=child, grandchild=grandchild, move=move)
+        grandchild += 1
+    else:
+      # criticality
+      writer.evaluation({**_parse_eval(block[1]), **search(0)})
+      for i, child_line in enumerate(block[2:]):
+        writer.evaluation({**_parse_eval(child_line), **search(1)}, child=i)
+    block = []
+  writer.close()
+
+
+@click.group()
+def cli():
+  pass
+
+
+@cli.command()
+@click.argument('text-path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('records-path', type=click.Path(dir_okay=False))
+def convert(text_path, records_path):
+  """Convert a text log into a record file"""
+  convert_text_log(text_path, records_path)
+
+
+@cli.command()
+@click.argument('records-path', type=click.Path(exists=True, dir_okay=False))
+def summary(records_path):
+  """Print the header and the number of positions and evaluations of a record file"""
+  header, positions, evaluations = read_records(records_path)
+  print(header)
+  print(f'{len(positions)} positions, {len(evaluations)} evaluations')
+  seconds = evaluations['seconds'][~np.isnan(evaluations['seconds'])]
+  if len(seconds):
+    print(f'{seconds.sum():.1f} seconds of evaluation ({seconds.mean()*1000:.1f} ms per evaluation)')
+
+
+if __name__ == '__main__':
+  cli()
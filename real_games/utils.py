@@ -1,20 +1,127 @@
 """Helpful functions to write logs and draw plots"""
 
+import os
+from real_games.records import RecordWriter, positions_path
+
+# header fields with statistics of the run, which may differ when a log is resumed
+RUN_STATISTICS = ('Eval cache', 'Top-moves cache')
+
+def _header_fields(header: str) -> dict:
+  """Fields (`name: value` lines, or whole lines) of a log header, without the statistics of the run"""
+  fields = {}
+  for line in header.splitlines():
+    name, _, value = line.strip().partition(': ')
+    if name and name not in RUN_STATISTICS:
+      fields[name] = value
+  return fields
+
 class Logger:
   """
   Logger
+
+  With `records_path`, the `record_*` methods also write binary records (see `real_games.records`),
+  otherwise they do nothing. A new log starts with `header`, which is also recorded.
+
+  With `resume`, an existing log is continued: lines after its last `END` (and records after its
+  last complete position) are removed, and `n_completed` is the number of positions already logged.
+  `resumed` tells whether there was a log to continue (which already has its header).
+  A log is only resumed with the same `header` (statistics of the run aside),
+  and with records only when it has them; otherwise a ValueError is raised before any file changes.
   """
-  def __init__(self, filepath):
+  def __init__(self, filepath, records_path=None, resume=False, header: str = None):
     """Create a .txt file with the current timestamp"""
-    self.file = open(filepath, 'w+')
     self.filepath = filepath
+    self.n_completed = 0
+    self.resumed = resume and os.path.exists(filepath) and os.path.getsize(filepath) > 0
+    if not self.resumed:
+      self.file = open(filepath, 'w+')
+      self.records = RecordWriter(records_path) if records_path is not None else None
+      if header is not None:
+        self.print(header)
+        self.record_header(header)
+      return
+
+    with open(filepath) as file:
+      lines = file.readlines()
+    # the header ends with the first empty line
+    end_of_header = next((i + 1 for i, line in enumerate(lines) if line.strip() == ''), len(lines))
+    if header is not None:
+      old_fields, fields = _header_fields(''.join(lines[:end_of_header])), _header_fields(header)
+      differences = [name for name in {**old_fields, **fields} if old_fields.get(name) != fields.get(name)]
+      if differences:
+        raise ValueError(f'{filepath} was written with other arguments ({", ".join(differences)}): '
+          'resume it with the same arguments, or start a new log')
+    end = max((i + 1 for i, line in enumerate(lines) if line.rstrip('\n') == 'END'), default=end_of_header)
+    self.n_completed = sum(line.rstrip('\n') == 'END' for line in lines)
+    records_exist = records_path is not None and os.path.exists(records_path) \
+      and os.path.exists(positions_path(records_path))
+    if records_path is not None and not records_exist and self.n_completed > 0:
+      raise ValueError(f'{filepath} was written without records: resume it without --records')
+
+    # records first: they fail when they have fewer positions than the log
+    if records_exist and self.n_completed > 0:
+      self.records = RecordWriter(records_path, keep_positions=self.n_completed)
+    elif records_path is not None:
+      # no complete position yet
+      self.records = RecordWriter(records_path)
+      self.record_header(''.join(lines[:end_of_header]))
+    else:
+      self.records = None
+    with open(filepath, 'w') as file:
+      file.writelines(lines[:end])
+    self.file = open(filepath, 'a')
 
   def print(self, info):
     print(info, file=self.file)
+
+  def record_header(self, header: str):
+    if self.records is not None:
+      self.records.header(header)
+
+  def record_position(self, position: str):
+    if self.records is not None:
+      self.records.position(position)
+
+  def record_evaluation(self, evaluation: dict, child: int = -1, grandchild: int = -1, move: str = ''):
+    if self.records is not None:
+      self.records.evaluation(evaluation, child, grandchild, move)
+
+  def end_position(self):
+    """
+    Log the `END` of a position and flush it to disk, records first,
+    so that every `END` in the log is a complete position for `resume`
+    """
+    if self.records is not None:
+      self.records.flush()
+    self.print("END")
+    self.file.flush()
   
   def close(self):
     print(f'Logged in {self.filepath}')
     self.file.close()
+    if self.records is not None:
+      self.records.close()
+
+class BufferLogger:
+  """
+  Keeps printed lines (and records) in memory, to be written into a Logger later
+  """
+  def __init__(self):
+    self.calls = []
+
+  def print(self, info):
+    self.calls.append(('print', (info,)))
+
+  def record_position(self, position: str):
+    self.calls.append(('record_position', (position,)))
+
+  def record_evaluation(self, evaluation: dict, child: int = -1, grandchild: int = -1, move: str = ''):
+    self.calls.append(('record_evaluation', (evaluation, child, grandchild, move)))
+
+  def flush_to(self, logger: Logger):
+    for method, args in self.calls:
+      getattr(logger, method)(*args)
+    self.calls = []
 
 def parse_eval(eval: dict) -> str:
   """
@@ -0,0 +1,268 @@
+"""
+Aggregate results of `synthetic_games.main` into error-rate curves (Figure 5 in the paper).
+
+A decision is an error if the chosen move at the root has a lower true utility
+than the best move. For every algorithm, the error rate after each iteration is
+averaged over all games, with a Wilson confidence interval.
+
+Result files are streamed one game at a time, so memory does not grow with the
+number of games. Two formats are read:
+  - `results.json`, as written by `synthetic_games.main`
+  - compact results: a directory with `args.json`, `move_utilities.npy` and one
+    `decisions-<algo>.npy` per algorithm (games x iterations), memory-mapped
+
+Command template
+    python -m synthetic_games.analysis curves logs/default-batch/figure5-2-1-chess-rand-10 --output curves.npz
+    python -m synthetic_games.analysis compact logs/default-batch/figure5-2-1-chess-rand-10/results.json
+"""
+
+import json
+import os
+import re
+from typing import Dict, Iterator, List, Tuple
+import click
+import numpy as np
+
+COMPACT_ARGS = 'args.json'
+COMPACT_UTILITIES = 'move_utilities.npy'
+COMPACT_DECISIONS = 'decisions-{}.npy'
+COMPACT_DIR = 'results-compact'
+CHUNK_SIZE = 1 << 20
+GAME_BLOCK = 256 # games per block when reading compact results
+
+
+def _find_key(file, key: str, chunk_size=CHUNK_SIZE) -> str:
+    """ Advance `file` past `"key": ` and return what is buffered after it ('' if not found) """
+    pattern = re.compile(r'"' + key + r'"\s*:\s*')
+    buffer = ''
+    while True:
+        match = pattern.search(buffer)
+        if match:
+            return buffer[match.end():]
+        chunk = file.read(chunk_size)
+        if chunk == '':
+            return ''
+        buffer = buffer[-len(key) - 16:] + chunk # keep a tail in case the key spans two chunks
+
+
+def _decode_stream(file, buffer: str, chunk_size=CHUNK_SIZE) -> Tuple[object, str]:
+    """ Decode the next JSON value from `buffer` + the rest of `file`. Return (value, rest of buffer) """
+    decoder = json.JSONDecoder()
+    while True:
+        stripped = buffer.lstrip(' \t\r\n,')
+        try:
+            value, end = decoder.raw_decode(stripped)
+            return value, stripped[end:]
+        except json.JSONDecodeError:
+            more = file.read(max(chunk_size, len(stripped))) # read ahead geometrically
+            if more == '':
+                raise
+            buffer = stripped + more
+
+
+def read_args(path: str) -> Dict:
+    """ Return the `args` of a result file (JSON or compact) """
+    if os.path.isdir(path):
+        with open(os.path.join(path, COMPACT_ARGS)) as file:
+            return json.load(file)
+    with open(path) as file:
+        buffer = _find_key(file, 'args')
+        return _decode_stream(file, buffer)[0] if buffer else {}
+
+
+def iter_json_games(path: str, chunk_size=CHUNK_SIZE) -> Iterator[Dict]:
+    """ Yield the games of a results.json one by one, without loading the whole file """
+    with open(path) as file:
+        buffer = _find_key(file, 'games', chunk_size).lstrip()
+        if not buffer.startswith('['):
+            return
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip(' \t\r\n,')
+            while buffer == '':
+                chunk = file.read(chunk_size)
+                if chunk == '':
+                    raise ValueError(f'{path}: truncated games array')
+                buffer = chunk.lstrip(' \t\r\n,')
+            if buffer[0] == ']':
+                return
+            game, buffer = _decode_stream(file, buffer, chunk_size)
+            yield game
+
+
+def _iter_compact_blocks(path: str) -> Iterator[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """ Yield (move utilities, {algo: decisions}) of compact results, in blocks of games """
+    utilities = np.load(os.path.join(path, COMPACT_UTILITIES), mmap_mode='r')
+    decisions = {}
+    for filename in sorted(os.listdir(path)):
+        match = re.fullmatch('(.+)'.join(map(re.escape, COMPACT_DECISIONS.split('{}'))), filename)
+        if match:
+            decisions[match.group(1)] = np.load(os.path.join(path, filename), mmap_mode='r')
+    for start in range(0, len(utilities), GAME_BLOCK):
+        end = start + GAME_BLOCK
+        yield (np.asarray(utilities[start:end]),
+            {algo: np.asarray(value[start:end]) for algo, value in decisions.items()})
+
+
+def _drop_shards(results: List[str]) -> List[str]:
+    """ Drop results of shards whose games are also in a concatenated result next to them (see sweep.py) """
+    shards = set()
+    for path in results:
+        for job_id in read_args(path).get('shards', []):
+            shards.add(os.path.normpath(os.path.join(os.path.dirname(os.path.dirname(path)), job_id)))
+    return [path for path in results if os.path.normpath(os.path.dirname(path)) not in shards]
+
+
+def find_results(paths: List[str]) -> List[str]:
+    """
+    Expand directories into the result files (JSON or compact) they contain.
+    Shards of a concatenated result are left out, so that every game is read once.
+    """
+    results = []
+    for path in paths:
+        if os.path.isfile(path) or os.path.exists(os.path.join(path, COMPACT_UTILITIES)):
+            results.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            if COMPACT_DIR in dirs:
+                # same data as results.json, cheaper to read
+                results.append(os.path.join(root, COMPACT_DIR))
+                dirs.remove(COMPACT_DIR)
+            elif 'results.json' in files:
+                results.append(os.path.join(root, 'results.json'))
+    return sorted(_drop_shards(results))
+
+
+class ErrorCurves:
+    """ Running sums of errors per algorithm and iteration """
+
+    def __init__(self):
+        self.errors: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, np.ndarray] = {}
+
+    def _add(self, algo: str, errors: np.ndarray, counts: np.ndarray) -> None:
+        """ Add per-iteration error sums and game counts of an algorithm """
+        num_iterations = len(errors)
+        if algo not in self.errors:
+            self.errors[algo] = np.zeros(0, dtype=np.int64)
+            self.counts[algo] = np.zeros(0, dtype=np.int64)
+        if len(self.errors[algo]) < num_iterations:
+            pad = num_iterations - len(self.errors[algo])
+            self.errors[algo] = np.pad(self.errors[algo], (0, pad))
+            self.counts[algo] = np.pad(self.counts[algo], (0, pad))
+        self.errors[algo][:num_iterations] += errors
+        self.counts[algo][:num_iterations] += counts
+
+    def add_game(self, game: Dict) -> None:
+        """ Add a game in the results.json format """
+        utilities = np.asarray(game['move_utilities'])
+        wrong = utilities < utilities.max()
+        for player in game['players']:
+            decisions = np.asarray(player['decisions'], dtype=np.int64)
+            self._add(player['algo'], wrong[decisions], np.ones(len(decisions), dtype=np.int64))
+
+    def add_block(self, utilities: np.ndarray, decisions: Dict[str, np.ndarray]) -> None:
+        """ Add a block of games in the compact format """
+        wrong = utilities < utilities.max(axis=1, keepdims=True)
+        for algo, block in decisions.items():
+            errors = np.take_along_axis(wrong, block.astype(np.int64), axis=1)
+            self._add(algo, errors.sum(axis=0), np.full(block.shape[1], len(block), dtype=np.int64))
+
+    def add_file(self, path: str) -> None:
+        if os.path.isdir(path):
+            for utilities, decisions in _iter_compact_blocks(path):
+                self.add_block(utilities, decisions)
+        else:
+            for game in iter_json_games(path):
+                self.add_game(game)
+
+    def curves(self, z: float = 1.96) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Return {algo: {error_rate, lower, upper, num_games}}, arrays indexed by iteration.
+        [lower, upper] is the Wilson score interval (z=1.96 for 95% confidence).
+        """
+        result = {}
+        for algo in self.errors:
+            n = self.counts[algo].astype(float)
+            p = self.errors[algo] / n
+            center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+            margin = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n)
+            result[algo] = {
+                'error_rate': p,
+                'lower': center - margin,
+                'upper': center + margin,
+                'num_games': self.counts[algo]
+            }
+        return result
+
+
+def write_compact(json_path: str, output_dir: str = None) -> str:
+    """ Convert a results.json into compact results, streaming its games. Return the output directory """
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(json_path), COMPACT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    args = read_args(json_path)
+    num_games = args['num_games']
+    b_factor = args['b_factor']
+
+    utilities = np.lib.format.open_memmap(os.path.join(output_dir, COMPACT_UTILITIES),
+        mode='w+', dtype=np.int8, shape=(num_games, b_factor))
+    decisions = {}
+    count = 0
+    for game in iter_json_games(json_path):
+        utilities[count] = game['move_utilities']
+        for player in game['players']:
+            algo = player['algo']
+            if algo not in decisions:
+                decisions[algo] = np.lib.format.open_memmap(
+                    os.path.join(output_dir, COMPACT_DECISIONS.format(algo)), mode='w+',
+                    dtype=np.uint8 if b_factor <= 256 else np.uint16,
+                    shape=(num_games, len(player['decisions'])))
+            decisions[algo][count] = player['decisions']
+        count += 1
+    assert count == num_games, f'{json_path}: expected {num_games} games, found {count}'
+
+    utilities.flush()
+    for value in decisions.values():
+        value.flush()
+    with open(os.path.join(output_dir, COMPACT_ARGS), 'w') as file:
+        json.dump(args, file, indent=2)
+    return output_dir
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--output', type=str, default='curves.npz', help='Output file (.npz)')
+@click.option('--z', type=float, default=1.96, help='z-score of the confidence interval')
+def curves(paths, output, z):
+    """ Compute error-rate-vs-iteration curves of all games in PATHS (files or directories) """
+    aggregator = ErrorCurves()
+    files = find_results(list(paths))
+    for i, path in enumerate(files):
+        print(f'File {i+1}/{len(files)}: {path}')
+        aggregator.add_file(path)
+
+    result = aggregator.curves(z)
+    arrays = {f'{algo}/{name}': value for algo, curve in result.items() for name, value in curve.items()}
+    np.savez(output, **arrays)
+    for algo, curve in result.items():
+        print(f'{algo}: {curve["num_games"][-1]} games, final error rate {curve["error_rate"][-1]:.4f} '
+            f'[{curve["lower"][-1]:.4f}, {curve["upper"][-1]:.4f}]')
+    print(f'Done. Curves saved in {output}')
+
+
+@cli.command()
+@click.argument('json-paths', nargs=-1, required=True)
+def compact(json_paths):
+    """ Convert results.json files into the compact format, next to each file """
+    for path in json_paths:
+        print(f'Compacted {path} into {write_compact(path)}')
+
+
+if __name__ == '__main__':
+    cli()
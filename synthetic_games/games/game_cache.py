@@ -0,0 +1,218 @@
+"""
+Content-addressed on-disk cache of generated CritGame trees.
+
+A cached game is a directory named after a hash of the game parameters:
+  meta.json -- game parameters, the state of the game's RNG and the name of the nodes file
+  nodes-<id>.npy -- one record per state ID (row 0 is unused), child IDs included
+
+Every save writes a new nodes file, then swaps meta.json in (one `os.replace`), so the nodes
+and the RNG state that a reader finds always belong to the same save, even while another
+process saves the same game. The nodes file of the previous save is removed afterwards,
+and so are nodes files that concurrent saves left unreferenced for `STALE_SECONDS`.
+
+nodes.npy is opened with `mmap_mode='r'`, so reopening a game costs
+nothing up front, and processes that read the same game share its pages.
+Nodes are only turned into dicts when the game touches them.
+
+Author: Khoi Nguyen
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections.abc import MutableMapping
+from typing import Dict, Optional
+import numpy as np
+from synthetic_games.games.crit_game import CritGame
+
+META_FILE = 'meta.json'
+# nodes file of games cached before nodes files were named in meta.json
+NODES_FILE = 'nodes.npy'
+# unreferenced nodes files older than this are left over by concurrent saves, not being written
+STALE_SECONDS = 600
+
+
+def node_dtype(b_factor: int) -> np.dtype:
+  """ Record type of a node in nodes.npy """
+  return np.dtype([
+    ('side', 'i1'),
+    ('depth', 'i4'),
+    ('minimax', 'i1'),
+    ('optimal_move', 'i4'),
+    ('heuristic', 'f8'), # NaN if not calculated yet
+    ('flip_rate', 'f8'),
+    ('move_at_root', 'i4'), # -1 for the root
+    ('child_id', 'i8', (b_factor,)), # 0 if the child is not created yet
+  ])
+
+
+def game_key(b_factor: int, depth: int, flip_rate, heuristic: str, seed: int, **extra) -> str:
+  """
+  Return the cache key of a game.
+  `extra` holds anything else that changes the game (e.g. the stdev of a gaussian heuristic).
+  """
+  params = dict(b_factor=b_factor, depth=depth, flip_rate=list(flip_rate),
+    heuristic=heuristic, seed=seed, **extra)
+  return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class MappedNodes(MutableMapping):
+  """
+  A `state -> node` mapping that reads nodes lazily from a memory-mapped array.
+  Nodes that are read or created are kept in `overlay`, so CritGame can mutate them as usual.
+  """
+
+  def __init__(self, nodes: np.ndarray):
+    self.nodes = nodes
+    self.overlay: Dict[int, Dict] = {}
+    self.num_stored = len(nodes) - 1
+    self.size = self.num_stored
+
+  def __getitem__(self, state: int) -> Dict:
+    if state in self.overlay:
+      return self.overlay[state]
+    if not 1 <= state <= self.num_stored:
+      raise KeyError(state)
+    record = self.nodes[state]
+    child_id = {move: int(child) for move, child in enumerate(record['child_id']) if child != 0}
+    move_at_root = int(record['move_at_root'])
+    node = dict(
+      side=int(record['side']),
+      depth=int(record['depth']),
+      minimax=int(record['minimax']),
+      optimal_move=int(record['optimal_move']),
+      heuristic=None if np.isnan(record['heuristic']) else float(record['heuristic']),
+      flip_rate=float(record['flip_rate']),
+      child_id=child_id,
+      move_at_root=None if move_at_root < 0 else move_at_root
+    )
+    self.overlay[state] = node
+    return node
+
+  def __setitem__(self, state: int, node: Dict) -> None:
+    self.overlay[state] = node
+    self.size = max(self.size, state)
+
+  def __delitem__(self, state: int) -> None:
+    raise TypeError('Nodes of a game cannot be deleted')
+
+  def __contains__(self, state) -> bool:
+    return isinstance(state, (int, np.integer)) and 1 <= state <= self.size
+
+  def __iter__(self):
+    return iter(range(1, self.size + 1))
+
+  def __len__(self) -> int:
+    return self.size
+
+
+def _to_array(game: CritGame) -> np.ndarray:
+  """ Return the nodes of a game as records, without materializing mapped nodes """
+  state_to_node = game._state_to_node
+  nodes = np.zeros(len(state_to_node) + 1, dtype=node_dtype(game.branching_factor))
+
+  if isinstance(state_to_node, MappedNodes):
+    nodes[:state_to_node.num_stored + 1] = state_to_node.nodes
+    states = state_to_node.overlay.keys()
+  else:
+    states = state_to_node.keys()
+
+  for state in states:
+    node = state_to_node[state]
+    child_id = np.zeros(game.branching_factor, dtype=np.int64)
+    for move, child in node['child_id'].items():
+      child_id[move] = child
+    nodes[state] = (
+      node['side'],
+      node['depth'],
+      node['minimax'],
+      node['optimal_move'],
+      np.nan if node['heuristic'] is None else node['heuristic'],
+      node['flip_rate'],
+      -1 if node['move_at_root'] is None else node['move_at_root'],
+      child_id
+    )
+  return nodes
+
+
+def save_game(game: CritGame, cache_dir: str, key: str) -> str:
+  """ Store `game` under `cache_dir/key` and return the directory of the cached game """
+  path = os.path.join(cache_dir, key)
+  os.makedirs(path, exist_ok=True)
+
+  nodes = _to_array(game)
+  _, rng_keys, rng_pos, has_gauss, cached_gaussian = game.randomness_source.get_state()
+  # a new file for every save: readers of the previous meta.json keep their nodes file
+  nodes_file = f'nodes-{uuid.uuid4().hex}.npy'
+  meta = dict(
+    nodes_file=nodes_file,
+    flip_rate=list(game.flip_rate),
+    b_factor=game.branching_factor,
+    depth=game.depth,
+    fixed_game=game.fixed_game,
+    rng_keys=rng_keys.tolist(),
+    rng_pos=int(rng_pos),
+    rng_has_gauss=int(has_gauss),
+    rng_cached_gaussian=float(cached_gaussian)
+  )
+
+  with open(os.path.join(path, nodes_file), 'wb') as file:
+    np.save(file, nodes)
+  previous = _read_meta(path)
+  # meta.json is written last: a save is only visible once its nodes are in place
+  tmp_meta = os.path.join(path, f'{META_FILE}.tmp-{os.getpid()}')
+  with open(tmp_meta, 'w') as file:
+    json.dump(meta, file)
+  os.replace(tmp_meta, os.path.join(path, META_FILE))
+  # processes that have them open or mapped keep reading them
+  previous_file = None if previous is None else previous.get('nodes_file', NODES_FILE)
+  now = time.time()
+  for name in os.listdir(path):
+    file_path = os.path.join(path, name)
+    if name == nodes_file or not name.endswith('.npy'):
+      continue
+    try:
+      if name == previous_file or now - os.path.getmtime(file_path) > STALE_SECONDS:
+        os.remove(file_path)
+    except FileNotFoundError:
+      pass # removed by a concurrent save
+  return path
+
+
+def _read_meta(path: str) -> Optional[Dict]:
+  """ Return meta.json of the cached game in `path`, or None if it has none """
+  try:
+    with open(os.path.join(path, META_FILE)) as file:
+      return json.load(file)
+  except FileNotFoundError:
+    return None
+
+
+def load_game(cache_dir: str, key: str) -> Optional[CritGame]:
+  """
+  Reopen a cached game, or return None if it is not in the cache.
+  The heuristic object is not cached: call `set_heuristic` on the result.
+  """
+  path = os.path.join(cache_dir, key)
+  meta = _read_meta(path)
+  while True:
+    if meta is None:
+      return None
+    try:
+      nodes = np.load(os.path.join(path, meta.get('nodes_file', NODES_FILE)), mmap_mode='r')
+      break
+    except FileNotFoundError:
+      # replaced by a concurrent save after meta.json was read: read the new one
+      previous, meta = meta, _read_meta(path)
+      if meta == previous:
+        return None # the nodes file is gone: generate the game again
+
+  game = CritGame(flip_rate=tuple(meta['flip_rate']), b_factor=meta['b_factor'],
+    depth=meta['depth'], fixed_game=meta['fixed_game'])
+  game._state_to_node = MappedNodes(nodes)
+  # continue the random stream where the cached game left it, so new nodes are reproducible
+  game.randomness_source.set_state(('MT19937', np.array(meta['rng_keys'], dtype=np.uint32), meta['rng_pos'],
+    meta['rng_has_gauss'], meta['rng_cached_gaussian']))
+  return game
@@ -1,19 +1,56 @@
+import os
 import pickle
+from functools import lru_cache
+from typing import Tuple
 import numpy as np
 from synthetic_games.heuristics.base import BaseHeuristic
 
+HEURISTIC_DATA_DIR = os.path.join('synthetic_games', 'heuristics', 'heuristic_data')
+
+
+def normalize_histogram(hist) -> Tuple[np.ndarray, np.ndarray]:
+  """ Scale both halves of a histogram into [0, 1], using their common min and max """
+  hist = [np.asarray(hist[0]), np.asarray(hist[1])]
+  min_heuristic = min(hist[0].min(), hist[1].min())
+  max_heuristic = max(hist[0].max(), hist[1].max())
+  return tuple((h - min_heuristic) / (max_heuristic - min_heuristic) for h in hist)
+
+
+def _npy_path(hist_name: str, win: bool) -> str:
+  return os.path.join(HEURISTIC_DATA_DIR, f'{hist_name}-{int(win)}.npy')
+
+
+@lru_cache(maxsize=None)
+def load_histogram(hist_name: str) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Return the normalized histogram of a real game: (values of losing nodes, values of winning nodes).
+
+  Loaded once per process. The normalized values are stored as `<hist_name>-{0,1}.npy`
+  and memory-mapped, so pool workers share the same pages. If they do not exist yet,
+  the pickled histogram is normalized and the .npy files are written for next time.
+  """
+  paths = [_npy_path(hist_name, win) for win in (False, True)]
+  if all(os.path.exists(path) for path in paths):
+    return tuple(np.load(path, mmap_mode='r') for path in paths)
+
+  with open(os.path.join(HEURISTIC_DATA_DIR, hist_name + '.pkl'), 'rb') as f:
+    normalized = normalize_histogram(pickle.load(f))
+  try:
+    for path, values in zip(paths, normalized):
+      tmp_path = f'{path}.tmp-{os.getpid()}'
+      with open(tmp_path, 'wb') as f:
+        np.save(f, values)
+      os.replace(tmp_path, path)
+  except OSError:
+    pass # read-only checkout: keep using the in-memory copy
+  return normalized
+
 
 class EmpiricalHeuristic(BaseHeuristic):
   def __init__(self, hist_name: str):
-    with open('synthetic_games/heuristics/heuristic_data/'+hist_name+'.pkl', 'rb') as f:
-      self.hist = pickle.load(f)
-    self.min_heuristic = min(min(self.hist[0]), min(self.hist[1]))
-    self.max_heuristic = max(max(self.hist[0]), max(self.hist[1]))
-  
+    self.normalized_hist = load_histogram(hist_name)
+
   def get_eval(self, game, node_id: int) -> float:
-    """ Return heuristic based on histogram of real game data """
+    """ Return heuristic based on histogram of real game data, normalized into [0, 1] """
     minimax = game._get_node(node_id)['minimax']
-    sample = np.random.choice(self.hist[minimax > 0])
-    # normalize into [0, 1]
-    ret = (sample - self.min_heuristic) / (self.max_heuristic - self.min_heuristic)
-    return ret
\ No newline at end of file
+    return np.random.choice(self.normalized_hist[minimax > 0])
@@ -1,7 +1,8 @@
+from functools import lru_cache
 import numpy as np
 from synthetic_games.games.game import Game
 from synthetic_games.heuristics.base import BaseHeuristic
-from synthetic_games.heuristics.empirical import EmpiricalHeuristic
+from synthetic_games.heuristics.empirical import EmpiricalHeuristic, normalize_histogram
 
 
 class PerfectHeuristic(BaseHeuristic):
@@ -17,33 +18,50 @@ class ZeroHeuristic(BaseHeuristic): # Not tested
     """Return 0 :)"""
     return 0
 
+def _sample_noise_histogram(source, distribution: str, stdev: float, sample_size: int):
+  sample = source.normal if distribution == 'gaussian' else source.uniform
+  return normalize_histogram([
+    -1 + sample(0, stdev, size=sample_size),
+    +1 + sample(0, stdev, size=sample_size)
+  ])
+
+@lru_cache(maxsize=16)
+def _seeded_noise_histogram(distribution: str, stdev: float, sample_size: int, seed: int):
+  """The histogram sampled right after seeding with `seed`, and the random state after sampling it"""
+  source = np.random.RandomState(seed)
+  return _sample_noise_histogram(source, distribution, stdev, sample_size), source.get_state()
+
+def noise_histogram(distribution: str, stdev: float, sample_size: int, seed: int = None):
+  """
+  Return a normalized histogram of the true utilities (-1, +1) plus noise,
+  sampled from the global NumPy random state.
+  With `seed`, the global state is first seeded with it. The histogram is then cached per
+  (distribution, stdev, sample size, seed), and a cache hit leaves the global state as sampling would,
+  so a game seeded with `--seed` gets the same heuristic and random draws wherever it runs.
+  """
+  if seed is None:
+    return _sample_noise_histogram(np.random, distribution, stdev, sample_size)
+  histogram, state = _seeded_noise_histogram(distribution, stdev, sample_size, seed)
+  np.random.set_state(state)
+  return histogram
+
 class GaussianHeuristic(EmpiricalHeuristic):
   """
   Adding Gaussian noise into the true utility
   The heuristic values are already normalized into [0, 1]
   """
-  def __init__(self, stdev: float, sample_size: int=10**5): 
+  def __init__(self, stdev: float, sample_size: int=10**5, seed: int=None): 
     # Initialize a Gaussian distribution
-    self.hist = [
-        -1 + np.random.normal(0, stdev, size=sample_size),
-        +1 + np.random.normal(0, stdev, size=sample_size)
-    ]
-    self.min_heuristic = min(min(self.hist[0]), min(self.hist[1]))
-    self.max_heuristic = max(max(self.hist[0]), max(self.hist[1]))
+    self.normalized_hist = noise_histogram('gaussian', stdev, sample_size, seed)
   
   def get_eval(self, game, node_id: int) -> float:
     # Because we use historgram, we reuse the code of empirical heuristics
     return super().get_eval(game, node_id)
 
 class UniformHeuristic(EmpiricalHeuristic):
-  def __init__(self, stdev: float, sample_size: int=10**5): 
-    # Initialize a Gaussian distribution
-    self.hist = [
-        -1 + np.random.uniform(0, stdev, size=sample_size),
-        +1 + np.random.uniform(0, stdev, size=sample_size)
-    ]
-    self.min_heuristic = min(min(self.hist[0]), min(self.hist[1]))
-    self.max_heuristic = max(max(self.hist[0]), max(self.hist[1]))
+  def __init__(self, stdev: float, sample_size: int=10**5, seed: int=None): 
+    # Initialize a uniform distribution
+    self.normalized_hist = noise_histogram('uniform', stdev, sample_size, seed)
   
   def get_eval(self, game, node_id: int) -> float:
     # Because we use historgram, we reuse the code of empirical heuristics
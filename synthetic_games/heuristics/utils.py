@@ -15,9 +15,9 @@ def create_heuristic(name: str, **kwargs) -> BaseHeuristic:
   elif name in EMPIRICAL_HEURISTICS:
     return EmpiricalHeuristic(name)
   elif name == 'gaussian':
-    return GaussianHeuristic(kwargs['stdev'])
+    return GaussianHeuristic(kwargs['stdev'], seed=kwargs.get('seed'))
   elif name == 'uniform':
-    return UniformHeuristic(kwargs['stdev'])
+    return UniformHeuristic(kwargs['stdev'], seed=kwargs.get('seed'))
   elif name == 'expected-playout':
     return ExpectedPlayoutHeuristic()
   else:
@@ -18,6 +18,7 @@ from synthetic_games.algos.uct import UCTPlayer
 from synthetic_games.algos.uct_minimax import UCTMinimaxPlayer
 from synthetic_games.algos.alphabeta import AlphaBetaPlayer
 from synthetic_games.games.crit_game import CritGame
+from synthetic_games.games.game_cache import game_key, load_game, save_game
 import os
 import subprocess
 import pandas
@@ -46,6 +47,10 @@ import json
 
 @click.option('--num-games', type=int, default=1)
 @click.option('--timeout', type=int, default=1800, help='timeout for each search, in second unit')
+@click.option('--seed', type=int, default=None,
+    help='Random seed of the first game; game i uses seed + i. Required for --game-cache.')
+@click.option('--game-cache', type=str, default=None,
+    help='Directory of the on-disk game cache. Crit games are reopened from and saved to it.')
 
 # @click.option('--reward', type=float, default=0) # FIXME: what is this?
 # @click.option('--punishment', type=float, default=0)
@@ -54,6 +59,8 @@ import json
 # @click.option('--uniform-lower', type=float, default=-1.5, help='Lower bound for noise of Uniform heuristic')
 # @click.option('--uniform-upper', type=float, default=1.5, help='Upper bound for noise of Uniform heuristic')
 def main(**kwargs):
+    if kwargs["game_cache"] is not None and kwargs["seed"] is None:
+        raise click.UsageError('--game-cache requires --seed')
     print(kwargs)
     # Create log directory
     log_path = os.path.join('logs', kwargs["batch_id"], kwargs["job_id"])
@@ -74,10 +81,25 @@ def main(**kwargs):
             'players': []
         }
         
+        seed = None if kwargs["seed"] is None else kwargs["seed"] + game_id
+        if seed is not None:
+            random.seed(seed) # heuristic values are sampled from the global numpy RNG
+
         # INIT THE GAME: create the game, prepare variables#
+        cache_key = None
         if kwargs["game_type"] == 'crit':
-            game:CritGame = CritGame(depth=kwargs["game_depth"], flip_rate=(kwargs["flip_rate"], kwargs["flip_rate"]), b_factor=kwargs["b_factor"])
-            game.set_heuristic(create_heuristic(kwargs["heuristic"], stdev=kwargs["stdev"]))
+            flip_rate = (kwargs["flip_rate"], kwargs["flip_rate"])
+            heuristic = create_heuristic(kwargs["heuristic"], stdev=kwargs["stdev"], seed=seed)
+            game = None
+            if kwargs["game_cache"] is not None:
+                extra = {'stdev': kwargs["stdev"]} if kwargs["heuristic"] in ['gaussian', 'uniform'] else {}
+                cache_key = game_key(kwargs["b_factor"], kwargs["game_depth"], flip_rate,
+                    kwargs["heuristic"], seed, **extra)
+                game = load_game(kwargs["game_cache"], cache_key)
+                print(f'Game cache {"hit" if game is not None else "miss"}: {cache_key}')
+            if game is None:
+                game:CritGame = CritGame(depth=kwargs["game_depth"], flip_rate=flip_rate, b_factor=kwargs["b_factor"], random_seed=seed)
+            game.set_heuristic(heuristic)
         else:
             assert kwargs["game_type"] == 'p'
             game = get_pgame(kwargs["game_depth"], kwargs["b_factor"], kwargs["heuristic"])
@@ -87,12 +109,19 @@ def main(**kwargs):
             current_game_result['move_utilities'].append(game._get_node(state)['minimax'])
 
         # save game for reuse
-        save_data(game, os.path.join(log_path, 'game'))
+        if cache_key is None:
+            save_data(game, os.path.join(log_path, 'game'))
+        else:
+            save_game(game, kwargs["game_cache"], cache_key)
 
         # RUN THE ALGORITHMS
         for algo in algos:
             print(f'Algo {algo}')
-            game: Game = get_data(os.path.join(log_path, 'game'))
+            if cache_key is None:
+                game: Game = get_data(os.path.join(log_path, 'game'))
+            else:
+                game = load_game(kwargs["game_cache"], cache_key)
+                game.set_heuristic(heuristic)
             """
             for alphabeta, algo is 'ab-<depth>'
             for uct, algo is 'uct-<bias_constant>-<num_iterations>'
@@ -122,7 +151,10 @@ def main(**kwargs):
             })
 
             # RECORD THE GAME STATE FOR REUSE
-            save_data(game, os.path.join(log_path, 'game'))
+            if cache_key is None:
+                save_data(game, os.path.join(log_path, 'game'))
+            else:
+                save_game(game, kwargs["game_cache"], cache_key)
         
         # SAVE TO DATAFRAMES
         all_results['games'].append(current_game_result)
@@ -132,7 +164,7 @@ def main(**kwargs):
     # breakpoint()
     with open(os.path.join(log_path, 'results.json'), 'w') as f:
         json.dump(all_results, f, indent=2)
-    os.system(f'rm {log_path}/game') # delete the game file
+    os.system(f'rm -f {log_path}/game') # delete the game file
     print(f'Done. Results saved in {log_path}')
 
 if __name__ == '__main__':
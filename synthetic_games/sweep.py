@@ -0,0 +1,186 @@
+"""
+Script to run a grid of `synthetic_games.main` experiments on all local CPUs
+
+Every configuration of the grid is split into shards of `--games-per-shard` games.
+Shards run as separate `synthetic_games.main` processes on a worker pool, failed
+shards are retried, and the shards of each configuration are concatenated into
+`logs/<sweep-id>/<config>/results.json`. Shards are kept apart, in `logs/<sweep-id>-shards`,
+so that the sweep directory has every game once. A shard is done once its results.json
+exists, so re-running the same command resumes an interrupted sweep.
+
+The grid spec is a JSON object. Lists are grid axes, other values are passed
+to every job as they are. Keys are the options of `synthetic_games.main`.
+The default spec is the grid of Figure 5 in the paper (see PAPER_GRID).
+
+Command template
+    python -m synthetic_games.sweep figure5 --games-per-shard 25
+    python -m synthetic_games.sweep mini --grid grid.json --workers 4 --seed 0
+"""
+
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import click
+from synthetic_games.analysis import iter_json_games, read_args
+
+PAPER_GRID = {
+    'b_factor': [2, 5, 8],
+    'flip_rate': [0.9, 1],
+    'heuristic': ['chess-rand-10', 'chess-pseu-10'],
+    'game_type': 'crit',
+    'game_depth': 50,
+    'algo_set': 'uct',
+    'num_games': 500,
+}
+
+
+def expand_grid(grid: Dict) -> List[Dict]:
+    """ Return one dict of options per point of the grid """
+    axes = [key for key, value in grid.items() if isinstance(value, list)]
+    fixed = {key: value for key, value in grid.items() if key not in axes}
+    configs = []
+    for values in itertools.product(*[grid[key] for key in axes]):
+        config = dict(fixed)
+        config.update(zip(axes, values))
+        config['name'] = '-'.join(str(value) for value in values)
+        configs.append(config)
+    return configs
+
+
+def make_shards(sweep_id: str, configs: List[Dict], games_per_shard: int, seed: int = None) -> List[Dict]:
+    """ Split every config into shards of at most `games_per_shard` games """
+    shards = []
+    for config in configs:
+        options = {key: value for key, value in config.items() if key not in ['name', 'num_games']}
+        num_games = config.get('num_games', 1)
+        for index, start in enumerate(range(0, num_games, games_per_shard)):
+            shard_options = dict(options, num_games=min(games_per_shard, num_games - start))
+            if seed is not None:
+                shard_options['seed'] = seed + start # games keep distinct seeds across shards
+            shards.append({
+                'config': f'{sweep_id}-{config["name"]}',
+                'job_id': f'{sweep_id}-{config["name"]}-shard{index}',
+                'options': shard_options,
+                'status': 'pending',
+                'attempts': 0,
+            })
+    return shards
+
+
+def _shards_batch(sweep_id: str) -> str:
+    """ Batch id of the shards of a sweep """
+    return f'{sweep_id}-shards'
+
+
+def _results_path(sweep_id: str, job_id: str) -> str:
+    return os.path.join('logs', _shards_batch(sweep_id), job_id, 'results.json')
+
+
+def run_shard(sweep_id: str, shard: Dict, retries: int) -> Dict:
+    """ Run a shard as a subprocess until it succeeds or runs out of retries """
+    command = [sys.executable, '-m', 'synthetic_games.main', shard['job_id'], '--batch-id', _shards_batch(sweep_id)]
+    for key, value in shard['options'].items():
+        command += [f'--{key.replace("_", "-")}', str(value)]
+
+    output_path = os.path.join('logs', _shards_batch(sweep_id), shard['job_id'] + '.out')
+    while shard['attempts'] <= retries:
+        shard['attempts'] += 1
+        with open(output_path, 'a') as output:
+            process = subprocess.run(command, stdout=output, stderr=subprocess.STDOUT)
+        if process.returncode == 0 and os.path.exists(_results_path(sweep_id, shard['job_id'])):
+            shard['status'] = 'done'
+            return shard
+        print(f'Shard {shard["job_id"]} failed (attempt {shard["attempts"]}), see {output_path}')
+    shard['status'] = 'failed'
+    return shard
+
+
+def concatenate_shards(sweep_id: str, config: str, job_ids: List[str]) -> str:
+    """ Stream the games of all shards into one results.json, renumbering the games """
+    output_dir = os.path.join('logs', sweep_id, config)
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, 'results.json')
+
+    args = read_args(_results_path(sweep_id, job_ids[0]))
+    args['job_id'] = config
+    args['num_games'] = sum(read_args(_results_path(sweep_id, job_id))['num_games'] for job_id in job_ids)
+    args['shards'] = job_ids
+
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write('{\n  "args": ' + json.dumps(args) + ',\n  "games": [\n')
+        game_id = 0
+        for job_id in job_ids:
+            for game in iter_json_games(_results_path(sweep_id, job_id)):
+                game['id'] = game_id
+                file.write((',\n' if game_id > 0 else '') + json.dumps(game))
+                game_id += 1
+        file.write('\n  ]\n}\n')
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def _save_state(sweep_id: str, shards: List[Dict]) -> None:
+    with open(os.path.join('logs', sweep_id, 'sweep.json'), 'w') as file:
+        json.dump(shards, file, indent=2)
+
+
+@click.command()
+@click.argument('sweep-id', type=str)
+@click.option('--grid', type=str, default=None, help='JSON file of the grid spec. Defaults to the paper grid.')
+@click.option('--games-per-shard', type=int, default=25, help='Number of games of each job')
+@click.option('--workers', type=int, default=os.cpu_count(), help='Number of jobs running at the same time')
+@click.option('--retries', type=int, default=2, help='Number of retries of a failed job')
+@click.option('--seed', type=int, default=None, help='Random seed of the first game of every config')
+def main(sweep_id, grid, games_per_shard, workers, retries, seed):
+    if grid is None:
+        spec = PAPER_GRID
+    else:
+        with open(grid) as file:
+            spec = json.load(file)
+    os.makedirs(os.path.join('logs', sweep_id), exist_ok=True)
+    os.makedirs(os.path.join('logs', _shards_batch(sweep_id)), exist_ok=True)
+
+    configs = expand_grid(spec)
+    shards = make_shards(sweep_id, configs, games_per_shard, seed)
+    for shard in shards:
+        if os.path.exists(_results_path(sweep_id, shard['job_id'])):
+            shard['status'] = 'done' # finished in a previous run
+    pending = [shard for shard in shards if shard['status'] != 'done']
+    print(f'{len(configs)} configs, {len(shards)} shards, {len(pending)} to run on {workers} workers')
+    _save_state(sweep_id, shards)
+
+    # RUN THE SHARDS
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_shard, sweep_id, shard, retries) for shard in pending]
+        for count, future in enumerate(futures):
+            shard = future.result()
+            print(f'[{count+1}/{len(pending)}] {shard["job_id"]}: {shard["status"]}')
+            _save_state(sweep_id, shards)
+
+    # CONCATENATE THE SHARDS OF EACH CONFIG
+    failed = []
+    for config in dict.fromkeys(shard['config'] for shard in shards):
+        config_shards = [shard for shard in shards if shard['config'] == config]
+        if any(shard['status'] != 'done' for shard in config_shards):
+            failed.append(config)
+            continue
+        path = concatenate_shards(sweep_id, config, [shard['job_id'] for shard in config_shards])
+        print(f'Concatenated {len(config_shards)} shards into {path}')
+
+    if failed:
+        print(f'Incomplete configs (re-run the same command to resume): {failed}')
+        sys.exit(1)
+    print(f'Done. Results saved in logs/{sweep_id}')
+
+
+if __name__ == '__main__':
+    tic = time.time()
+    main()
+    toc = time.time()
+    print('Total time:', toc - tic, 'seconds')
@@ -0,0 +1,72 @@
+import json
+import os
+import numpy as np
+import pytest
+from synthetic_games.analysis import ErrorCurves, find_results, iter_json_games, write_compact
+
+
+def write_results(path, games, **args):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    args = dict(b_factor=2, num_games=len(games), **args)
+    with open(path, 'w') as file:
+        json.dump({'args': args, 'games': games}, file)
+
+
+def game(game_id, utilities, decisions):
+    return {'id': game_id, 'move_utilities': utilities, 'players': [{'algo': 'uct-1-4', 'decisions': decisions}]}
+
+
+GAMES = [game(0, [1, -1], [0, 1, 0, 0]), game(1, [-1, 1], [0, 0, 1, 1]), game(2, [1, 1], [1, 0, 1, 0])]
+
+
+def test_wilson_interval():
+    curves = ErrorCurves()
+    curves._add('algo', np.array([5, 0, 10]), np.array([10, 10, 10]))
+    curve = curves.curves()['algo']
+    assert curve['error_rate'].tolist() == [0.5, 0, 1]
+    assert curve['lower'] == pytest.approx([0.2366, 0, 0.7225], abs=1e-4)
+    assert curve['upper'] == pytest.approx([0.7634, 0.2775, 1], abs=1e-4)
+
+
+def test_errors_of_games():
+    curves = ErrorCurves()
+    for result in GAMES:
+        curves.add_game(result)
+    curve = curves.curves()['uct-1-4']
+    # a decision is an error when its move is worse than the best move (none in game 2)
+    assert curve['num_games'].tolist() == [3, 3, 3, 3]
+    assert (curve['error_rate'] * 3).round().tolist() == [1, 2, 0, 0]
+
+
+def test_compact_results_have_the_same_curves(tmp_path):
+    path = str(tmp_path / 'job' / 'results.json')
+    write_results(path, GAMES)
+    assert list(iter_json_games(path, chunk_size=7)) == GAMES
+
+    from_json, from_compact = ErrorCurves(), ErrorCurves()
+    from_json.add_file(path)
+    from_compact.add_file(write_compact(path))
+    for name, value in from_json.curves()['uct-1-4'].items():
+        assert np.array_equal(from_compact.curves()['uct-1-4'][name], value), name
+
+
+def test_find_results_reads_every_game_once(tmp_path):
+    # sweep directory of an older layout: shards next to their concatenation
+    sweep = tmp_path / 'sweep'
+    write_results(str(sweep / 'sweep-2-shard0' / 'results.json'), GAMES[:2])
+    write_results(str(sweep / 'sweep-2-shard1' / 'results.json'), GAMES[2:])
+    write_results(str(sweep / 'sweep-2' / 'results.json'), GAMES, shards=['sweep-2-shard0', 'sweep-2-shard1'])
+    # a config whose shards are not concatenated yet
+    write_results(str(sweep / 'sweep-5-shard0' / 'results.json'), GAMES[:1])
+
+    assert find_results([str(sweep)]) == sorted([
+        str(sweep / 'sweep-2' / 'results.json'),
+        str(sweep / 'sweep-5-shard0' / 'results.json'),
+    ])
+
+
+def test_find_results_prefers_compact(tmp_path):
+    path = str(tmp_path / 'job' / 'results.json')
+    write_results(path, GAMES)
+    compact = write_compact(path)
+    assert find_results([str(tmp_path)]) == [compact]
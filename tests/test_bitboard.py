@@ -0,0 +1,56 @@
+import pytest
+from real_games.othello.src.bitboard import Board, canonical, flip_diagonal, flip_vertical, \
+  mirror_horizontal, symmetries
+
+
+def perft(board: Board, depth: int) -> int:
+  """No. move sequences of `depth` moves (passes are automatic, and the game may end earlier)"""
+  if depth == 0 or board.is_game_over():
+    return 1
+  total = 0
+  for move in board.legal_moves():
+    child = board.copy()
+    child.play(move)
+    total += perft(child, depth - 1)
+  return total
+
+
+def test_initial_moves():
+  board = Board()
+  assert board.legal_moves() == ['D3', 'C4', 'F5', 'E6']
+  board.play('F5')
+  assert not board.black_to_move
+  assert board.legal_moves() == ['F4', 'D6', 'F6']
+
+
+@pytest.mark.parametrize('depth, count', [(1, 4), (2, 12), (3, 56), (4, 244)])
+def test_perft(depth, count):
+  assert perft(Board(), depth) == count
+
+
+def test_illegal_move():
+  with pytest.raises(ValueError):
+    Board().play('A1')
+
+
+def test_symmetries_are_involutions():
+  board = Board.from_moves('F5D6C3')
+  for symmetry in (flip_vertical, mirror_horizontal, flip_diagonal):
+    assert symmetry(symmetry(board.player)) == board.player
+  images = symmetries(board.player)
+  assert len(images) == 8 and images[0] == board.player
+  assert all(bin(image).count('1') == bin(board.player).count('1') for image in images)
+
+
+def canonical_after(moves: str):
+  board = Board.from_moves(moves)
+  return canonical(board.player, board.opponent)
+
+
+def test_canonical_openings():
+  # the 4 first moves are symmetric
+  assert len({canonical_after(moves) for moves in ['F5', 'E6', 'D3', 'C4']}) == 1
+  # diagonal, perpendicular and parallel openings are 3 different positions
+  assert len({canonical_after(moves) for moves in ['F5F4', 'F5D6', 'F5F6']}) == 3
+  # the perpendicular opening, mirrored over the A1-H8 diagonal
+  assert canonical_after('F5D6') == canonical_after('E6F4')
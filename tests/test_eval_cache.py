@@ -0,0 +1,48 @@
+from real_games.chess_game.src.stockfish import Engine
+from real_games.eval_cache import EvalCache
+
+
+def test_hits_and_misses(tmp_path):
+  path = str(tmp_path / 'cache.db')
+  cache = EvalCache(path)
+  assert cache.get('a') is None
+  cache.put('a', {'type': 'cp', 'value': 30})
+  assert cache.get('a') == {'type': 'cp', 'value': 30}
+  assert cache.get('a') == {'type': 'cp', 'value': 30}
+  assert cache.get('b') is None
+  assert (cache.hits, cache.misses, len(cache)) == (2, 2, 1)
+  assert cache.run_summary() == 'Eval cache of this run: 2 hits, 2 misses (hit rate: 50.0%)'
+  cache.close()
+
+  # totals add up the runs, a new run starts from 0
+  cache = EvalCache(path, name='Top-moves cache')
+  assert cache.total_stats() == {'hits': 2, 'misses': 2}
+  assert cache.run_summary() == 'Top-moves cache of this run: 0 hits, 0 misses (hit rate: n/a)'
+  assert cache.get('a') == {'type': 'cp', 'value': 30}
+  cache.close()
+  cache = EvalCache(path)
+  assert cache.total_stats() == {'hits': 3, 'misses': 2}
+  assert cache.summary() == f'{path} (1 evaluations, hit rate of previous runs: 60.0% of 5)'
+  cache.close()
+
+
+def engine_at(fen: str, moves):
+  """Engine with no process: any command to it fails"""
+  engine = Engine.__new__(Engine)
+  engine._position = (fen, moves)
+  engine._parameters = {'Hash': 16, 'Threads': 1}
+  engine.depth = '10'
+  return engine
+
+
+def test_keys_of_positions_set_from_a_fen():
+  fen = 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1'
+  key = engine_at(fen, [])._eval_key()
+  # the fullmove number does not change the evaluation
+  assert key == engine_at(fen[:-1] + '9', [])._eval_key()
+  assert key.startswith('rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0|depth 10|')
+  assert engine_at(fen, ['e7e5'])._eval_key() != key
+
+  engine = engine_at(fen, [])
+  engine.set_nodes(1000)
+  assert engine._eval_key() != key
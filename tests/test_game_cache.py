@@ -0,0 +1,51 @@
+import os
+from synthetic_games.games.crit_game import CritGame
+from synthetic_games.games.game_cache import game_key, load_game, save_game
+
+
+def move_utilities(game: CritGame):
+  return [game._get_node(game.get_new_state(1, move))['minimax'] for move in range(game.branching_factor)]
+
+
+def expand(game: CritGame, depth: int):
+  """Nodes of the first `depth` plies, created on the way"""
+  states, nodes = [1], []
+  for _ in range(depth):
+    states = [game.get_new_state(state, move) for state in states for move in range(game.branching_factor)]
+    nodes += [game._get_node(state) for state in states]
+  return nodes
+
+
+def test_round_trip(tmp_path):
+  game = CritGame(flip_rate=(0.9, 0.9), b_factor=3, depth=10, random_seed=5)
+  utilities = move_utilities(game)
+  key = game_key(3, 10, (0.9, 0.9), 'chess-rand-10', 5)
+  save_game(game, str(tmp_path), key)
+
+  cached = load_game(str(tmp_path), key)
+  assert move_utilities(cached) == utilities
+  # new nodes continue the random stream of the saved game
+  assert expand(cached, 3) == expand(game, 3)
+
+
+def test_save_again(tmp_path):
+  game = CritGame(b_factor=2, depth=8, random_seed=1)
+  key = game_key(2, 8, (1, 1), 'chess-rand-10', 1)
+  move_utilities(game)
+  save_game(game, str(tmp_path), key)
+  expand(game, 2)
+  path = save_game(game, str(tmp_path), key)
+  # the nodes file of the previous save is removed
+  assert len([name for name in os.listdir(path) if name.endswith('.npy')]) == 1
+  assert expand(load_game(str(tmp_path), key), 2) == expand(game, 2)
+
+
+def test_keys():
+  key = game_key(2, 50, (1, 1), 'gaussian', 0, stdev=0.25)
+  assert key == game_key(2, 50, [1, 1], 'gaussian', 0, stdev=0.25)
+  assert key != game_key(2, 50, (1, 1), 'gaussian', 1, stdev=0.25)
+  assert key != game_key(2, 50, (1, 1), 'gaussian', 0, stdev=0.5)
+
+
+def test_missing_game(tmp_path):
+  assert load_game(str(tmp_path), game_key(2, 50, (1, 1), 'chess-rand-10', 0)) is None
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from real_games.chess_game.src.assess import assess_criticality, evaluate, legal_moves
+from real_games.engine_pool import completed
+from real_games.records import EVAL_DTYPE, RecordWriter, convert_text_log, positions_path, read_records
+from real_games.utils import Logger
+
+FENS = ['rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1',
+  'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2']
+
+
+def write_records(path, n_positions=2):
+  writer = RecordWriter(path)
+  writer.header('Objective: test\n  Search depth: 3\n')
+  for i, fen in enumerate(FENS[:n_positions]):
+    writer.position(fen)
+    writer.evaluation({'type': 'cp', 'value': 10 * i, 'depth': 3, 'seconds': 0.5})
+    writer.evaluation({'type': 'mate', 'value': -2, 'depth': 2}, child=0, move='e7e5')
+    writer.evaluation({'type': 'cp', 'value': 7, 'nodes': 1000}, child=1, grandchild=0, move='d7d5 c2c4')
+  writer.close()
+
+
+def test_round_trip(tmp_path):
+  path = str(tmp_path / 'test.rec')
+  write_records(path)
+  header, positions, evaluations = read_records(path)
+  assert header == 'Objective: test\n  Search depth: 3'
+  assert positions == FENS
+  assert evaluations.dtype == EVAL_DTYPE
+  assert evaluations['position'].tolist() == [0, 0, 0, 1, 1, 1]
+  assert evaluations['child'].tolist() == [-1, 0, 1] * 2
+  assert evaluations['grandchild'].tolist() == [-1, -1, 0] * 2
+  assert evaluations['move'].tolist() == [b'', b'e7e5', b'd7d5 c2c4'] * 2
+  assert evaluations['depth'].tolist() == [3, 2, -1] * 2
+  assert evaluations['nodes'].tolist() == [0, 0, 1000] * 2
+  assert evaluations['score_type'].tolist() == [0, 1, 0] * 2
+  assert evaluations['value'].tolist() == [0, -2, 7, 10, -2, 7]
+  assert evaluations['seconds'][0] == 0.5 and np.isnan(evaluations['seconds'][1])
+
+  _, _, mapped = read_records(path, mmap=True)
+  assert mapped.tobytes() == evaluations.tobytes()
+
+
+def test_resume_keeps_complete_positions(tmp_path):
+  path = str(tmp_path / 'test.rec')
+  write_records(path)
+  # an evaluation and a position cut by a crash
+  with open(path, 'ab') as file:
+    file.write(b'\0' * 5)
+  with open(positions_path(path), 'ab') as file:
+    file.write(b'rnbq')
+
+  writer = RecordWriter(path, keep_positions=1)
+  writer.position(FENS[0])
+  writer.evaluation({'type': 'cp', 'value': 42, 'depth': 3})
+  writer.close()
+  header, positions, evaluations = read_records(path)
+  assert header == 'Objective: test\n  Search depth: 3'
+  assert positions == [FENS[0], FENS[0]]
+  assert evaluations['position'].tolist() == [0, 0, 0, 1]
+  assert evaluations['value'].tolist() == [0, -2, 7, 42]
+
+  with pytest.raises(ValueError):
+    RecordWriter(path, keep_positions=3)
+
+
+def test_older_format_is_refused(tmp_path):
+  path = tmp_path / 'old.rec'
+  path.write_bytes(b'RGREC1\nH\0\0\0\0')
+  (tmp_path / 'old.rec.positions').write_bytes(b'')
+  with pytest.raises(ValueError, match='version'):
+    read_records(str(path))
+
+
+class StubExecutor:
+  """Executor answering the tasks of `assess_criticality` without an engine"""
+  def submit(self, task, fen, moves, *args):
+    if task is legal_moves:
+      return completed(['e2e4', 'd2d4', 'g1f3'])
+    assert task is evaluate
+    depth = args[0]
+    return completed({'type': 'cp', 'value': 10 * len(moves) + len(fen) % 7, 'depth': depth, 'nodes': None,
+      'seconds': 0.01})
+
+
+def test_converted_text_log_matches_native_records(tmp_path):
+  text_path, records_path = str(tmp_path / 'crit.txt'), str(tmp_path / 'crit.rec')
+  header = 'Objective: criticality\n  Num positions: 2\n  Position depth: 4\n  Search depth: 3\n  Num top moves: 0\n  '
+  logger = Logger(text_path, records_path, header=header)
+  for fen in FENS:
+    assess_criticality(None, logger, {'fen': fen}, 3, pool=StubExecutor())
+    logger.end_position()
+  logger.close()
+
+  convert_text_log(text_path, str(tmp_path / 'converted.rec'))
+  native = read_records(records_path)
+  converted = read_records(str(tmp_path / 'converted.rec'))
+  assert converted[0] == native[0]
+  assert converted[1] == native[1] == FENS
+  # text logs have neither the moves of criticality children nor timings
+  for field in EVAL_DTYPE.names:
+    if field not in ('move', 'seconds'):
+      assert np.array_equal(converted[2][field], native[2][field]), field
+  assert len(native[2]) == 2 * 4